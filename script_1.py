@@ -1,162 +1,222 @@
 import cv2
 import json
+import gzip
+import importlib.util
 from datetime import datetime
 from pathlib import Path
 from ultralytics import YOLO
-from collections import OrderedDict
+import torch
+from collections import Counter, OrderedDict, deque
 import time
+import itertools
+import math
 import numpy as np
-from flask import Flask, Response, render_template_string, jsonify, request, send_file
+from flask import Flask, Response, stream_with_context, request, send_file
 import threading
 import queue
 import logging
 import signal
 import sys
 import os
+import argparse
 from werkzeug.utils import secure_filename
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class ProfessionalYOLOAnnotator:
-    def __init__(self, output_file='annotations.json', flask_port=3000):
-        """
-        Профессиональный аннотатор с современным веб-интерфейсом
-        
-        Args:
-            output_file: путь к выходному JSON файлу
-            flask_port: порт для Flask сервера
-        """
-        self.model = YOLO('best.pt')
-        self.output_file = Path(output_file)
-        self.annotations = OrderedDict()
-        
-        # Параметры для оптимизации
-        self.prev_objects = None
-        self.position_threshold = 50
-        self.iou_threshold = 0.3
-        
-        # Очередь для кадров
-        self.frame_queue = queue.Queue(maxsize=30)
-        self.latest_frame = None
-        self.frame_lock = threading.Lock()
-        
-        # Статистика
-        self.stats = {
-            'total_frames': 0,
-            'saved_frames': 0,
-            'total_objects': 0,
-            'fps': 0,
-            'start_time': time.time(),
-            'object_counts': {},
-            'detection_history': [],
-            'hourly_stats': {}
-        }
-        
-        # Контроль работы
-        self.running = True
-        self.flask_port = flask_port
-        self.pause_annotation = False
-        
-        # Камера
-        self.current_camera_index = 0
-        self.available_cameras = self._get_available_cameras()
-        
-        # Открытие камеры
-        self.cap = cv2.VideoCapture(self.current_camera_index)
-        if not self.cap.isOpened():
-            logger.error(f"Не удалось открыть камеру {self.current_camera_index}")
-            raise Exception(f"Не удалось открыть камеру {self.current_camera_index}")
-        
-        # Настройка камеры для лучшей производительности
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        
-        # Папка для скриншотов
-        self.screenshots_dir = Path("screenshots")
-        self.screenshots_dir.mkdir(exist_ok=True)
-        
-        # Запуск Flask
-        self.flask_thread = threading.Thread(target=self.start_flask_server)
-        self.flask_thread.daemon = True
-        self.flask_thread.start()
-        
-        # Обработка сигналов для корректного завершения
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
-        
-        logger.info(f"Инициализация завершена. Порт: {flask_port}")
-        logger.info(f"Доступные камеры: {self.available_cameras}")
+# Пулы потоков OpenCV и PyTorch по умолчанию занимают все ядра и конкурируют
+# с потоками веб-сервера. Число потоков инференса: SYSMON_INFERENCE_THREADS
+def _inference_threads():
+    """Число потоков инференса из SYSMON_INFERENCE_THREADS (некорректное значение - по умолчанию)"""
+    default = max(1, (os.cpu_count() or 2) // 2)
+    value = os.environ.get('SYSMON_INFERENCE_THREADS')
+    if value is None:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(f"Некорректное SYSMON_INFERENCE_THREADS={value!r}, используется {default}")
+        return default
+
+INFERENCE_THREADS = _inference_threads()
+cv2.setNumThreads(1)
+torch.set_num_threads(INFERENCE_THREADS)
+# TF32 на тензорных ядрах (Ampere+) для оставшихся FP32 операций
+if hasattr(torch, 'set_float32_matmul_precision'):
+    torch.set_float32_matmul_precision('high')
+else:
+    # torch < 1.12
+    torch.backends.cuda.matmul.allow_tf32 = True
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
     
-    def _get_available_cameras(self):
-        """Получить список доступных камер"""
-        available_cameras = []
-        for i in range(5):  # Проверяем первые 5 индексов
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret:
-                    available_cameras.append({
-                        'index': i,
-                        'name': f'Камера {i}',
-                        'resolution': f'{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}'
-                    })
-                cap.release()
-        return available_cameras
+    # Без numba функции выполняются как обычный Python
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # Запасной C-сериализатор, если orjson не установлен
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    # Компактный двоичный формат для автосохранений
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    # Flask < 2.2 не поддерживает подмену JSON-провайдера
+    DefaultJSONProvider = None
+
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
+
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # Нет PyTurboJPEG или самой библиотеки libjpeg-turbo
+    _turbo_jpeg = None
+
+try:
+    import asyncio
+    from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+    from av import VideoFrame
+except ImportError:
+    # Без aiortc видео отдается только как MJPEG
+    VideoStreamTrack = None
+
+def _encode_jpeg(frame, quality=85):
+    """Кодирование кадра в JPEG (libjpeg-turbo, если доступен)"""
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(frame, quality=quality, jpeg_subsample=TJSAMP_420)
+    ok, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return jpeg.tobytes() if ok else None
+
+# Кодировщики стандартного json создаются один раз, а не при каждом вызове dumps
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
+_json_encode_indent = json.JSONEncoder(ensure_ascii=False, indent=2).encode
+
+def _json_bytes(obj, indent=False):
+    """Сериализация в JSON (orjson или ujson, если установлены)"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    if ujson is not None:
+        return ujson.dumps(obj, indent=2 if indent else 0, ensure_ascii=False).encode('utf-8')
+    return (_json_encode_indent if indent else _json_encode)(obj).encode('utf-8')
+
+class OrjsonProvider(DefaultJSONProvider or object):
+    """JSON-провайдер Flask на orjson: request.json разбирается без стандартного json"""
     
-    def switch_camera(self, camera_index):
-        """Переключение камеры"""
-        try:
-            # Закрываем текущую камеру
-            if hasattr(self, 'cap'):
-                self.cap.release()
-            
-            # Открываем новую камеру
-            self.current_camera_index = camera_index
-            self.cap = cv2.VideoCapture(camera_index)
-            
-            if not self.cap.isOpened():
-                logger.error(f"Не удалось открыть камеру {camera_index}")
-                return False
-            
-            # Настройка параметров
-            self.cap.set(cv2.CAP_PROP_FPS, 30)
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-            
-            # Сброс предыдущих объектов
-            self.prev_objects = None
-            
-            logger.info(f"Переключено на камеру {camera_index}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Ошибка при переключении камеры: {e}")
-            return False
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
     
-    def signal_handler(self, signum, frame):
-        """Обработчик сигналов для корректного завершения"""
-        logger.info(f"Получен сигнал {signum}, завершение работы...")
-        self.running = False
-        self.cleanup()
-        sys.exit(0)
+    def dumps(self, obj, **kwargs):
+        return _json_bytes(obj).decode('utf-8')
+
+def _json_response(obj):
+    """JSON-ответ Flask без прохода через jsonify"""
+    return Response(_json_bytes(obj), mimetype='application/json')
+
+@njit(cache=True, fastmath=True)
+def _iou_scalar(x11, y11, x21, y21, x12, y12, x22, y22):
+    """IoU двух рамок, заданных координатами"""
+    x_left = max(x11, x12)
+    y_top = max(y11, y12)
+    x_right = min(x21, x22)
+    y_bottom = min(y21, y22)
     
-    def cleanup(self):
-        """Очистка ресурсов"""
-        if hasattr(self, 'cap'):
-            self.cap.release()
-        cv2.destroyAllWindows()
-        self._save_to_json(final=True)
-        logger.info("Ресурсы освобождены")
+    if x_right < x_left or y_bottom < y_top:
+        return 0.0
     
-    def start_flask_server(self):
-        """Запуск Flask сервера с современным интерфейсом"""
-        app = Flask(__name__)
+    intersection = (x_right - x_left) * (y_bottom - y_top)
+    union = (x21 - x11) * (y21 - y11) + (x22 - x12) * (y22 - y12) - intersection
+    return intersection / union if union > 0 else 0.0
+
+@njit(cache=True, fastmath=True)
+def _boxes_changed(curr_boxes, prev_boxes, position_threshold, iou_threshold):
+    """Сдвинулась ли хотя бы одна из сопоставленных рамок формы (N, 4)"""
+    for i in range(curr_boxes.shape[0]):
+        cx1, cy1, cx2, cy2 = curr_boxes[i, 0], curr_boxes[i, 1], curr_boxes[i, 2], curr_boxes[i, 3]
+        px1, py1, px2, py2 = prev_boxes[i, 0], prev_boxes[i, 1], prev_boxes[i, 2], prev_boxes[i, 3]
+        if _iou_scalar(cx1, cy1, cx2, cy2, px1, py1, px2, py2) < iou_threshold:
+            return True
         
-        # Современный HTML интерфейс с Bootstrap 5
-        HTML_PAGE = """
+        distance = math.hypot((cx1 + cx2) // 2 - (px1 + px2) // 2,
+                              (cy1 + cy2) // 2 - (py1 + py2) // 2)
+        if distance > position_threshold:
+            return True
+    return False
+
+class FrameObjects:
+    """Объекты одного кадра, хранящиеся по столбцам в массивах NumPy"""
+    __slots__ = ('index', 'labels', 'cls', 'xyxy', 'conf', '_signature')
+    
+    def __init__(self, index=(), labels=(), cls=(), xyxy=(), conf=()):
+        # Номер объекта среди объектов того же класса; строковые id собираются только при необходимости
+        self.index = np.asarray(index, dtype=np.int16)
+        self.labels = list(labels)
+        self.cls = np.asarray(cls, dtype=np.int16)
+        self.xyxy = np.asarray(xyxy, dtype=np.int32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        self._signature = None
+    
+    def __len__(self):
+        return len(self.labels)
+    
+    @property
+    def signature(self):
+        """Структурная подпись кадра: классы и точные рамки без учета порядка"""
+        if self._signature is None:
+            # Без квантования: совпадение подписей означает IoU = 1 и нулевое смещение
+            rows = np.column_stack((self.cls.astype(np.int32), self.xyxy))
+            self._signature = rows[np.lexsort(rows.T[::-1])].tobytes()
+        return self._signature
+    
+    @property
+    def ids(self):
+        """Идентификаторы объектов вида label_index: не зависят от номера кадра и сопоставимы между кадрами"""
+        return [f"{label}_{i}" for i, label in zip(self.index.tolist(), self.labels)]
+    
+    def to_dict(self):
+        """Преобразование в словарь объектов (формат экспорта)"""
+        objects = OrderedDict()
+        for obj_id, label, cls_id, (x1, y1, x2, y2), conf in zip(
+                self.ids, self.labels, self.cls.tolist(), self.xyxy.tolist(), self.conf.tolist()):
+            objects[obj_id] = {
+                'label': label,
+                'class_id': cls_id,
+                'x1': x1,
+                'y1': y1,
+                'x2': x2,
+                'y2': y2,
+                'confidence': conf,
+                'width': x2 - x1,
+                'height': y2 - y1,
+                'center_x': (x1 + x2) // 2,
+                'center_y': (y1 + y2) // 2
+            }
+        return objects
+
+# Современный HTML интерфейс с Bootstrap 5
+HTML_PAGE = """
 <!DOCTYPE html>
 <html lang="ru">
 <head>
@@ -264,6 +324,11 @@ class ProfessionalYOLOAnnotator:
             box-shadow: 0 0 0 3px rgba(67, 97, 238, 0.2);
         }
         
+        /* Панели, обновляемые каждую секунду, пересчитываются изолированно */
+        #detectionsList, #currentObjects, #objectList, .modal-body {
+            contain: content;
+        }
+        
         .detection-item {
             padding: 12px;
             border-bottom: 1px solid rgba(0,0,0,0.1);
@@ -457,7 +522,7 @@ class ProfessionalYOLOAnnotator:
                     </div>
                     <div class="form-check form-switch mb-3">
                         <input class="form-check-input" type="checkbox" id="autoSave" checked>
-                        <label class="form-check-label" for="autoSave">Автосохранение каждые 10 кадров</label>
+                        <label class="form-check-label" for="autoSave">Автосохранение журнала на диск каждую секунду</label>
                     </div>
                 </div>
                 <div class="modal-footer">
@@ -476,22 +541,36 @@ class ProfessionalYOLOAnnotator:
         let updateInterval;
         let cameraThumbnails = {};
         
+        // Ссылки на элементы страницы ищутся один раз при загрузке
+        const D = {};
+        function initDomRefs() {
+            [
+                'confidenceThreshold', 'confidenceValue', 'iouThreshold', 'iouValue', 'cameraList',
+                'totalFrames', 'savedFrames', 'totalObjects', 'fpsDisplay', 'frameCount',
+                'objectCount', 'statusBadge', 'statusText', 'pauseBtn', 'currentObjects',
+                'detectionsList', 'objectList', 'objectDistributionChart', 'objectsOverTimeChart',
+                'detectionStatsChart', 'autoSave', 'settingsModal'
+            ].forEach(id => { D[id] = document.getElementById(id); });
+        }
+        
         // Инициализация при загрузке
         document.addEventListener('DOMContentLoaded', function() {
+            initDomRefs();
             loadCameras();
             updateStats();
             initCharts();
+            startWebRTC();
             
             // Обновление статистики каждую секунду
             updateInterval = setInterval(updateStats, 1000);
             
             // Инициализация слайдеров
-            document.getElementById('confidenceThreshold').addEventListener('input', function(e) {
-                document.getElementById('confidenceValue').textContent = e.target.value;
+            D.confidenceThreshold.addEventListener('input', function(e) {
+                D.confidenceValue.textContent = e.target.value;
             });
             
-            document.getElementById('iouThreshold').addEventListener('input', function(e) {
-                document.getElementById('iouValue').textContent = e.target.value;
+            D.iouThreshold.addEventListener('input', function(e) {
+                D.iouValue.textContent = e.target.value;
             });
         });
         
@@ -499,7 +578,7 @@ class ProfessionalYOLOAnnotator:
             fetch('/api/cameras')
                 .then(response => response.json())
                 .then(data => {
-                    const cameraList = document.getElementById('cameraList');
+                    const cameraList = D.cameraList;
                     cameraList.innerHTML = '';
                     
                     data.cameras.forEach(camera => {
@@ -564,86 +643,107 @@ class ProfessionalYOLOAnnotator:
         }
         
         function resetStats() {
-            document.getElementById('totalFrames').textContent = '0';
-            document.getElementById('savedFrames').textContent = '0';
-            document.getElementById('totalObjects').textContent = '0';
-            document.getElementById('fpsDisplay').textContent = 'FPS: 0';
-            document.getElementById('frameCount').textContent = 'Кадров: 0';
-            document.getElementById('objectCount').textContent = 'Объектов: 0';
+            D.totalFrames.textContent = '0';
+            D.savedFrames.textContent = '0';
+            D.totalObjects.textContent = '0';
+            D.fpsDisplay.textContent = 'FPS: 0';
+            D.frameCount.textContent = 'Кадров: 0';
+            D.objectCount.textContent = 'Объектов: 0';
         }
         
         function updateStats() {
             fetch('/api/stats')
                 .then(response => response.json())
-                .then(data => {
-                    // Обновление основной статистики
-                    document.getElementById('totalFrames').textContent = data.total_frames.toLocaleString();
-                    document.getElementById('savedFrames').textContent = data.saved_frames.toLocaleString();
-                    document.getElementById('totalObjects').textContent = data.total_objects.toLocaleString();
-                    document.getElementById('fpsDisplay').textContent = `FPS: ${data.fps.toFixed(1)}`;
-                    document.getElementById('frameCount').textContent = `Кадров: ${data.total_frames}`;
-                    
-                    // Обновление статуса
-                    const statusBadge = document.getElementById('statusBadge');
-                    const statusText = document.getElementById('statusText');
-                    
-                    if (data.is_paused) {
-                        statusBadge.className = 'status-badge status-paused';
-                        statusText.textContent = 'ПАУЗА';
-                        document.getElementById('pauseBtn').innerHTML = '<i class="bi bi-play-circle me-2"></i>Возобновить';
-                    } else {
-                        statusBadge.className = 'status-badge status-active';
-                        statusText.textContent = 'АКТИВНО';
-                        document.getElementById('pauseBtn').innerHTML = '<i class="bi bi-pause-circle me-2"></i>Пауза';
-                    }
-                    
-                    // Обновление текущих объектов
-                    updateCurrentObjects(data.current_objects || {});
-                    
-                    // Обновление последних обнаружений
-                    updateDetectionsList(data.recent_detections || []);
-                    
-                    // Обновление списка объектов
-                    updateObjectList(data.object_counts || {});
-                    
-                    // Обновление графиков
-                    updateCharts(data);
-                })
+                .then(scheduleStatsRender)
                 .catch(error => {
                     console.error('Ошибка получения статистики:', error);
                 });
         }
         
+        // Все изменения DOM и графиков за тик статистики применяются одним кадром
+        let statsPending = null;
+        let statsData = null;
+        function scheduleStatsRender(data) {
+            statsData = data;
+            if (statsPending) return;
+            statsPending = requestAnimationFrame(() => {
+                statsPending = null;
+                applyStatsDom(statsData);
+                updateCharts(statsData);
+            });
+        }
+        
+        function applyStatsDom(data) {
+            // Обновление основной статистики
+            D.totalFrames.textContent = data.total_frames.toLocaleString();
+            D.savedFrames.textContent = data.saved_frames.toLocaleString();
+            D.totalObjects.textContent = data.total_objects.toLocaleString();
+            D.fpsDisplay.textContent = `FPS: ${data.fps.toFixed(1)}`;
+            D.frameCount.textContent = `Кадров: ${data.total_frames}`;
+            
+            // Обновление статуса
+            const statusBadge = D.statusBadge;
+            const statusText = D.statusText;
+            
+            if (data.is_paused) {
+                statusBadge.className = 'status-badge status-paused';
+                statusText.textContent = 'ПАУЗА';
+                D.pauseBtn.innerHTML = '<i class="bi bi-play-circle me-2"></i>Возобновить';
+            } else {
+                statusBadge.className = 'status-badge status-active';
+                statusText.textContent = 'АКТИВНО';
+                D.pauseBtn.innerHTML = '<i class="bi bi-pause-circle me-2"></i>Пауза';
+            }
+            
+            // Обновление текущих объектов
+            updateCurrentObjects(data.current_objects || {});
+            
+            // Обновление последних обнаружений
+            updateDetectionsList(data.recent_detections || []);
+            
+            // Обновление списка объектов
+            updateObjectList(data.object_counts || {});
+        }
+        
+        // Разметка заменяется только если она отличается от последней записанной:
+        // в статичной сцене списки не перестраиваются на каждом тике
+        const renderedHtml = new WeakMap();
+        function setHTML(el, html) {
+            if (renderedHtml.get(el) === html) return;
+            renderedHtml.set(el, html);
+            el.innerHTML = html;
+        }
+        
         function updateCurrentObjects(objects) {
-            const currentObjectsDiv = document.getElementById('currentObjects');
+            const currentObjectsDiv = D.currentObjects;
             const objectCount = Object.keys(objects).length;
             
-            document.getElementById('objectCount').textContent = `Объектов: ${objectCount}`;
+            D.objectCount.textContent = `Объектов: ${objectCount}`;
             
             if (objectCount === 0) {
-                currentObjectsDiv.innerHTML = '<span class="text-muted">Нет объектов</span>';
+                setHTML(currentObjectsDiv, '<span class="text-muted">Нет объектов</span>');
                 return;
             }
             
-            // Группируем объекты по классам
+            // Группируем объекты по классам (сортировка - для стабильной разметки)
             const classCounts = {};
             Object.values(objects).forEach(obj => {
                 classCounts[obj.label] = (classCounts[obj.label] || 0) + 1;
             });
             
             let html = '';
-            for (const [label, count] of Object.entries(classCounts)) {
+            for (const [label, count] of Object.entries(classCounts).sort()) {
                 html += `<span class="object-badge">${label}: ${count}</span>`;
             }
             
-            currentObjectsDiv.innerHTML = html;
+            setHTML(currentObjectsDiv, html);
         }
         
         function updateDetectionsList(detections) {
-            const detectionsList = document.getElementById('detectionsList');
+            const detectionsList = D.detectionsList;
             
             if (detections.length === 0) {
-                detectionsList.innerHTML = '<div class="text-center text-muted py-4">Нет обнаружений</div>';
+                setHTML(detectionsList, '<div class="text-center text-muted py-4">Нет обнаружений</div>');
                 return;
             }
             
@@ -663,25 +763,28 @@ class ProfessionalYOLOAnnotator:
                 `;
             });
             
-            detectionsList.innerHTML = html;
+            setHTML(detectionsList, html);
         }
         
         function updateObjectList(objectCounts) {
-            const objectList = document.getElementById('objectList');
+            const objectList = D.objectList;
             
             if (Object.keys(objectCounts).length === 0) {
-                objectList.innerHTML = '<div class="text-muted text-center">Нет данных</div>';
+                setHTML(objectList, '<div class="text-muted text-center">Нет данных</div>');
                 return;
             }
             
-            let html = '<div class="row">';
-            const sortedObjects = Object.entries(objectCounts)
+            const parts = ['<div class="row">'];
+            const entries = Object.entries(objectCounts);
+            // Сумма считается один раз, а не для каждой строки
+            const total = entries.reduce((sum, [, count]) => sum + count, 0) || 1;
+            const sortedObjects = entries
                 .sort((a, b) => b[1] - a[1])
                 .slice(0, 8); // Показываем топ-8
             
             sortedObjects.forEach(([label, count]) => {
-                const percentage = (count / Object.values(objectCounts).reduce((a, b) => a + b, 0)) * 100;
-                html += `
+                const percentage = (count / total) * 100;
+                parts.push(`
                     <div class="col-6 mb-2">
                         <div class="d-flex justify-content-between">
                             <span>${label}</span>
@@ -691,16 +794,16 @@ class ProfessionalYOLOAnnotator:
                             <div class="progress-bar" role="progressbar" style="width: ${percentage}%"></div>
                         </div>
                     </div>
-                `;
+                `);
             });
-            html += '</div>';
+            parts.push('</div>');
             
-            objectList.innerHTML = html;
+            setHTML(objectList, parts.join(''));
         }
         
         function initCharts() {
             // Chart 1: Распределение объектов (круговая диаграмма)
-            const ctx1 = document.getElementById('objectDistributionChart').getContext('2d');
+            const ctx1 = D.objectDistributionChart.getContext('2d');
             charts.distribution = new Chart(ctx1, {
                 type: 'doughnut',
                 data: {
@@ -724,7 +827,7 @@ class ProfessionalYOLOAnnotator:
             });
             
             // Chart 2: Объекты во времени (линейный график)
-            const ctx2 = document.getElementById('objectsOverTimeChart').getContext('2d');
+            const ctx2 = D.objectsOverTimeChart.getContext('2d');
             charts.timeline = new Chart(ctx2, {
                 type: 'line',
                 data: {
@@ -759,7 +862,7 @@ class ProfessionalYOLOAnnotator:
             });
             
             // Chart 3: Статистика обнаружений (столбчатая диаграмма)
-            const ctx3 = document.getElementById('detectionStatsChart').getContext('2d');
+            const ctx3 = D.detectionStatsChart.getContext('2d');
             charts.stats = new Chart(ctx3, {
                 type: 'bar',
                 data: {
@@ -795,7 +898,7 @@ class ProfessionalYOLOAnnotator:
                 
                 charts.distribution.data.labels = labels;
                 charts.distribution.data.datasets[0].data = counts;
-                charts.distribution.update();
+                charts.distribution.update('none');
             }
             
             // Обновление временного графика
@@ -809,7 +912,7 @@ class ProfessionalYOLOAnnotator:
                 
                 charts.timeline.data.labels = labels;
                 charts.timeline.data.datasets[0].data = counts;
-                charts.timeline.update();
+                charts.timeline.update('none');
             }
             
             // Обновление статистики (пример для конкретных классов)
@@ -820,7 +923,7 @@ class ProfessionalYOLOAnnotator:
                 // Обновляем только если есть изменения
                 if (JSON.stringify(charts.stats.data.datasets[0].data) !== JSON.stringify(counts)) {
                     charts.stats.data.datasets[0].data = counts;
-                    charts.stats.update();
+                    charts.stats.update('none');
                 }
             }
         }
@@ -858,9 +961,9 @@ class ProfessionalYOLOAnnotator:
         }
         
         function applySettings() {
-            const confidence = document.getElementById('confidenceThreshold').value;
-            const iou = document.getElementById('iouThreshold').value;
-            const autoSave = document.getElementById('autoSave').checked;
+            const confidence = D.confidenceThreshold.value;
+            const iou = D.iouThreshold.value;
+            const autoSave = D.autoSave.checked;
             
             fetch('/api/update_settings', {
                 method: 'POST',
@@ -877,42 +980,485 @@ class ProfessionalYOLOAnnotator:
             .then(data => {
                 alert('Настройки применены!');
                 // Закрываем модальное окно
-                bootstrap.Modal.getInstance(document.getElementById('settingsModal')).hide();
+                bootstrap.Modal.getInstance(D.settingsModal).hide();
             });
         }
         
+        // Видео через WebRTC, если сервер его поддерживает; иначе остается MJPEG
+        async function startWebRTC() {
+            if (!window.RTCPeerConnection) {
+                return;
+            }
+            
+            try {
+                const pc = new RTCPeerConnection();
+                pc.addTransceiver('video', { direction: 'recvonly' });
+                const img = document.getElementById('video');
+                const video = document.createElement('video');
+                video.id = 'video';
+                video.className = img.className;
+                video.autoplay = true;
+                video.muted = true;
+                video.playsInline = true;
+                pc.ontrack = (event) => {
+                    video.srcObject = new MediaStream([event.track]);
+                };
+                // track приходит до установки ICE/DTLS: MJPEG заменяется только после
+                // подключения и возвращается, если соединение не удалось
+                pc.onconnectionstatechange = () => {
+                    if (pc.connectionState === 'connected' && img.isConnected) {
+                        // Замена img закрывает MJPEG-поток
+                        img.replaceWith(video);
+                    } else if (pc.connectionState === 'failed') {
+                        pc.close();
+                        video.srcObject = null;
+                        if (video.isConnected) {
+                            // Новый URL открывает MJPEG-поток заново
+                            img.src = '/video?t=' + Date.now();
+                            video.replaceWith(img);
+                        }
+                    }
+                };
+                
+                await pc.setLocalDescription(await pc.createOffer());
+                await new Promise(resolve => {
+                    if (pc.iceGatheringState === 'complete') {
+                        resolve();
+                        return;
+                    }
+                    pc.addEventListener('icegatheringstatechange', () => {
+                        if (pc.iceGatheringState === 'complete') {
+                            resolve();
+                        }
+                    });
+                });
+                
+                const response = await fetch('/api/webrtc/offer', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ sdp: pc.localDescription.sdp, type: pc.localDescription.type })
+                });
+                if (!response.ok) {
+                    pc.close();
+                    return;
+                }
+                await pc.setRemoteDescription(await response.json());
+            } catch (error) {
+                console.error('WebRTC недоступен, используется MJPEG:', error);
+            }
+        }
+        
         // Функция для открытия модального окна настроек
         function openSettings() {
-            const modal = new bootstrap.Modal(document.getElementById('settingsModal'));
+            const modal = new bootstrap.Modal(D.settingsModal);
             modal.show();
         }
     </script>
 </body>
 </html>
 """
+
+# Страница статична - кодируется и сжимается один раз при импорте
+_INDEX_HTML = HTML_PAGE.encode('utf-8')
+_INDEX_GZ = gzip.compress(_INDEX_HTML, 9)
+
+if VideoStreamTrack is not None:
+    class AnnotatedVideoTrack(VideoStreamTrack):
+        """WebRTC-трек с последним кадром веб-интерфейса"""
+        def __init__(self, annotator):
+            super().__init__()
+            self.annotator = annotator
+        
+        async def recv(self):
+            pts, time_base = await self.next_timestamp()
+            _, frame = self.annotator._latest
+            while frame is None:
+                await asyncio.sleep(0.01)
+                _, frame = self.annotator._latest
+            
+            video_frame = VideoFrame.from_ndarray(frame, format='bgr24')
+            video_frame.pts = pts
+            video_frame.time_base = time_base
+            return video_frame
+
+class ProfessionalYOLOAnnotator:
+    def __init__(self, output_file='annotations.json', flask_port=3000):
+        """
+        Профессиональный аннотатор с современным веб-интерфейсом
+        
+        Args:
+            output_file: путь к выходному JSON файлу
+            flask_port: порт для Flask сервера
+        """
+        self.model = self._load_model('best.pt')
+        self._warmup_model()
+        # Компиляция numba до первого кадра
+        _iou_scalar(0, 0, 1, 1, 0, 0, 1, 1)
+        _boxes_changed(np.zeros((1, 4), np.int32), np.zeros((1, 4), np.int32), 50, 0.3)
+        self.output_file = Path(output_file)
+        self.annotations = OrderedDict()
+        # Ограничение числа хранимых кадров (старые вытесняются)
+        self.max_saved_frames = 10000
+        # Финальное сохранение с отступами собирается в памяти целиком только до этого числа кадров,
+        # больше - пишется потоком по кадру, как автосохранение
+        self.pretty_save_max_frames = 1000
+        # Версия хранилища аннотаций и версии, уже записанные в файлы
+        self._annotations_version = 0
+        self._saved_versions = {}
+        # Сохранения выполняются по одному: иначе более старая версия может заменить более новую
+        self._save_lock = threading.Lock()
+        # Журнал аннотаций в формате JSON Lines: одна строка на сохраненный кадр
+        self.journal_file = self.output_file.with_suffix('.jsonl')
+        self._journal = open(self.journal_file, 'ab', buffering=1 << 20)
+        # Автосохранение: буфер журнала сбрасывается на диск раз в journal_flush_interval секунд
+        # (фоновым потоком, вне цикла захвата). Каждая запись - один вызов write, поэтому
+        # сброс происходит только на границе записей
+        self.auto_save = True
+        self.journal_flush_interval = 1.0
+        # Последние обнаружения и кэш ответа /api/stats
+        self._recent_detections = deque(maxlen=32)
+        self.stats_cache_ttl = 0.2
+        self._stats_cache = (0.0, None)
+        
+        # Параметры для оптимизации
+        self.prev_objects = None
+        self.position_threshold = 50
+        self.iou_threshold = 0.3
+        
+        # Очередь для кадров
+        # Последний кадр для веб-интерфейса: кортеж (номер, кадр) заменяется
+        # одним присваиванием, поэтому читатели обходятся без блокировки
+        self._frame_seq = itertools.count(1)
+        self._latest = (0, None)
+        self._frame_event = threading.Event()
+        # JPEG последнего кадра, общий для всех MJPEG-клиентов
+        self._latest_jpeg = (0, None)
+        self._jpeg_ready = threading.Condition()
+        
+        # WebRTC: aiortc работает в собственном цикле asyncio
+        self._rtc_loop = None
+        self._peer_connections = set()
+        if VideoStreamTrack is not None:
+            self._rtc_loop = asyncio.new_event_loop()
+            threading.Thread(target=self._rtc_loop.run_forever, daemon=True).start()
+        
+        # Статистика
+        self.stats = {
+            'total_frames': 0,
+            'saved_frames': 0,
+            'total_objects': 0,
+            'fps': 0,
+            'start_time': time.time(),
+            'object_counts': Counter(),
+            'detection_history': deque(maxlen=600),
+            'hourly_stats': {}
+        }
+        
+        # Контроль работы
+        self.running = True
+        self.flask_port = flask_port
+        self.pause_annotation = False
+        
+        # Камера
+        self.current_camera_index = 0
+        self.available_cameras = self._get_available_cameras()
+        
+        # Открытие камеры
+        self.cap = cv2.VideoCapture(self.current_camera_index)
+        if not self.cap.isOpened():
+            logger.error(f"Не удалось открыть камеру {self.current_camera_index}")
+            raise Exception(f"Не удалось открыть камеру {self.current_camera_index}")
+        
+        # Настройка камеры для лучшей производительности
+        self.cap.set(cv2.CAP_PROP_FPS, 30)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        
+        # Папка для скриншотов
+        self.screenshots_dir = Path("screenshots")
+        self.screenshots_dir.mkdir(exist_ok=True)
+        
+        # Запись снимков
+        # Ограниченная очередь: при лавине запросов снимки отклоняются, а не копятся в памяти
+        self.snapshot_queue = queue.Queue(maxsize=16)
+        self.snapshot_thread = threading.Thread(target=self._snapshot_worker)
+        self.snapshot_thread.daemon = True
+        self.snapshot_thread.start()
+        
+        # Промежуточные сохранения в фоне: запросы, пришедшие во время записи, объединяются в одно
+        self._save_requested = threading.Event()
+        self.save_thread = threading.Thread(target=self._save_worker)
+        self.save_thread.daemon = True
+        self.save_thread.start()
+        
+        # Кодирование видеопотока
+        self.encoder_thread = threading.Thread(target=self._stream_encoder)
+        self.encoder_thread.daemon = True
+        self.encoder_thread.start()
+        
+        # Запуск Flask
+        self.flask_thread = threading.Thread(target=self.start_flask_server)
+        self.flask_thread.daemon = True
+        self.flask_thread.start()
+        
+        # Обработка сигналов для корректного завершения
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+        
+        logger.info(f"Инициализация завершена. Порт: {flask_port}")
+        logger.info(f"Доступные камеры: {self.available_cameras}")
+    
+    def _load_model(self, weights):
+        """Загрузка модели и однократный экспорт в TensorRT (GPU) или OpenVINO (CPU)"""
+        model = YOLO(weights)
+        weights = Path(model.ckpt_path)
+        # Набор данных для INT8-калибровки (необязательный)
+        calib = weights.with_name('calib.yaml')
+        
+        try:
+            # FP16 TensorRT имеет смысл только на GPU с тензорными ядрами (Volta+)
+            if torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 7:
+                # NMS встраивается в движок и выполняется на GPU. Его параметры фиксируются при
+                # экспорте (IoU 0.7 с учетом классов) и совпадают с параметрами вызова модели в run()
+                export_args = {'format': 'engine', 'half': True, 'nms': True, 'batch': 1, 'imgsz': 640}
+                if calib.exists():
+                    export_args.update(int8=True, data=str(calib))
+                # Профиль экспорта входит в имя файла: движки с другими параметрами
+                # (в том числе от server.py) не подхватываются по ошибке
+                engine = weights.with_name(f"{weights.stem}_b1_640_nms"
+                                           f"{'_int8' if calib.exists() else ''}.engine")
+                if not engine.exists():
+                    logger.info("Экспорт модели в TensorRT...")
+                    os.replace(model.export(**export_args), engine)
+                logger.info(f"Используется TensorRT модель: {engine}")
+                return YOLO(str(engine), task='detect')
+            
+            if calib.exists() and importlib.util.find_spec('openvino'):
+                openvino_dir = weights.with_name(f"{weights.stem}_int8_openvino_model")
+                if not openvino_dir.exists():
+                    logger.info("Экспорт модели в OpenVINO INT8...")
+                    openvino_dir = Path(model.export(format='openvino', int8=True, data=str(calib)))
+                logger.info(f"Используется OpenVINO модель: {openvino_dir}")
+                return YOLO(str(openvino_dir), task='detect')
+        except Exception as e:
+            logger.warning(f"Экспорт модели не удался, используется {weights.name}: {e}")
+        
+        return model
+    
+    def _warmup_model(self, runs=3):
+        """Прогрев модели, чтобы первый кадр не платил за инициализацию"""
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        for _ in range(runs):
+            self.model(dummy, verbose=False)
+    
+    def _snapshot_worker(self):
+        """Кодирование и запись снимков в фоне, чтобы не задерживать ответ"""
+        while self.running or not self.snapshot_queue.empty():
+            try:
+                filepath, frame, objects = self.snapshot_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            try:
+                if objects is not None:
+                    # Рамки рисуются на копии здесь, а не в потоке запроса
+                    frame = self._draw_objects(frame.copy(), objects)
+                jpeg = _encode_jpeg(frame, quality=90)
+                if jpeg is not None:
+                    filepath.write_bytes(jpeg)
+            except Exception as e:
+                logger.error(f"Ошибка записи снимка {filepath}: {e}")
+    
+    def _save_worker(self):
+        """Запись промежуточных сохранений и сброс журнала вне основного цикла захвата"""
+        last_flush = time.monotonic()
+        while self.running:
+            if self._save_requested.wait(timeout=0.5):
+                self._save_requested.clear()
+                self._save_to_json()
+            
+            now = time.monotonic()
+            if self.auto_save and now - last_flush >= self.journal_flush_interval:
+                last_flush = now
+                try:
+                    self._journal.flush()
+                except ValueError:
+                    # Журнал уже закрыт при завершении работы
+                    pass
+    
+    def _stream_encoder(self):
+        """Однократное кодирование каждого нового кадра для всех MJPEG-клиентов"""
+        last_seq = 0
+        while self.running:
+            if not self._frame_event.wait(timeout=0.5):
+                continue
+            self._frame_event.clear()
+            
+            seq, frame = self._latest
+            if seq == last_seq or frame is None:
+                continue
+            last_seq = seq
+            
+            # Компрессия для быстрой передачи
+            jpeg = _encode_jpeg(frame, quality=85)
+            if jpeg is None:
+                continue
+            
+            with self._jpeg_ready:
+                self._latest_jpeg = (seq, jpeg)
+                self._jpeg_ready.notify_all()
+    
+    async def _create_rtc_answer(self, offer):
+        """Создание WebRTC-соединения с видеотреком для браузера"""
+        pc = RTCPeerConnection()
+        self._peer_connections.add(pc)
+        
+        @pc.on('connectionstatechange')
+        async def on_connectionstatechange():
+            if pc.connectionState in ('failed', 'closed'):
+                self._peer_connections.discard(pc)
+                await pc.close()
+        
+        try:
+            pc.addTrack(AnnotatedVideoTrack(self))
+            await pc.setRemoteDescription(RTCSessionDescription(sdp=offer['sdp'], type=offer['type']))
+            await pc.setLocalDescription(await pc.createAnswer())
+        except BaseException:
+            # Ошибка или отмена согласования (таймаут запроса): соединение закрывается сразу
+            self._peer_connections.discard(pc)
+            await pc.close()
+            raise
+        return {'sdp': pc.localDescription.sdp, 'type': pc.localDescription.type}
+    
+    async def _close_peer_connections(self):
+        """Закрытие всех WebRTC-соединений"""
+        pcs = list(self._peer_connections)
+        self._peer_connections.clear()
+        await asyncio.gather(*(pc.close() for pc in pcs), return_exceptions=True)
+    
+    def _get_available_cameras(self):
+        """Получить список доступных камер"""
+        available_cameras = []
+        for i in range(5):  # Проверяем первые 5 индексов
+            cap = cv2.VideoCapture(i)
+            if cap.isOpened():
+                ret, frame = cap.read()
+                if ret:
+                    available_cameras.append({
+                        'index': i,
+                        'name': f'Камера {i}',
+                        'resolution': f'{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}'
+                    })
+                cap.release()
+        return available_cameras
+    
+    def switch_camera(self, camera_index):
+        """Переключение камеры"""
+        try:
+            # Закрываем текущую камеру
+            if hasattr(self, 'cap'):
+                self.cap.release()
+            
+            # Открываем новую камеру
+            self.current_camera_index = camera_index
+            self.cap = cv2.VideoCapture(camera_index)
+            
+            if not self.cap.isOpened():
+                logger.error(f"Не удалось открыть камеру {camera_index}")
+                return False
+            
+            # Настройка параметров
+            self.cap.set(cv2.CAP_PROP_FPS, 30)
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+            
+            # Сброс предыдущих объектов
+            self.prev_objects = None
+            
+            logger.info(f"Переключено на камеру {camera_index}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Ошибка при переключении камеры: {e}")
+            return False
+    
+    def signal_handler(self, signum, frame):
+        """Обработчик сигналов для корректного завершения"""
+        logger.info(f"Получен сигнал {signum}, завершение работы...")
+        self.running = False
+        self.cleanup()
+        sys.exit(0)
+    
+    def cleanup(self):
+        """Очистка ресурсов"""
+        if hasattr(self, 'cap'):
+            self.cap.release()
+        cv2.destroyAllWindows()
+        if self._rtc_loop is not None and self._peer_connections:
+            future = asyncio.run_coroutine_threadsafe(self._close_peer_connections(), self._rtc_loop)
+            try:
+                future.result(timeout=5)
+            except Exception as e:
+                logger.warning(f"Не удалось закрыть WebRTC-соединения: {e}")
+        self._save_to_json(final=True)
+        self._close_journal()
+        logger.info("Ресурсы освобождены")
+    
+    def _close_journal(self):
+        """Сброс журнала аннотаций на диск"""
+        if not self._journal.closed:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+    
+    def start_flask_server(self):
+        """Запуск Flask сервера с современным интерфейсом"""
+        app = Flask(__name__)
+        if orjson is not None and DefaultJSONProvider is not None:
+            # request.json и jsonify через orjson
+            app.json = OrjsonProvider(app)
         
         @app.route('/')
         def index():
-            return render_template_string(HTML_PAGE, port=self.flask_port)
+            headers = {'Cache-Control': 'public, max-age=3600', 'Vary': 'Accept-Encoding'}
+            if 'gzip' in request.accept_encodings:
+                headers['Content-Encoding'] = 'gzip'
+                return Response(_INDEX_GZ, mimetype='text/html', headers=headers)
+            return Response(_INDEX_HTML, mimetype='text/html', headers=headers)
+        
+        @app.route('/api/webrtc/offer', methods=['POST'])
+        def webrtc_offer():
+            """Видеопоток через WebRTC (если установлен aiortc)"""
+            if self._rtc_loop is None:
+                return _json_response({'error': 'WebRTC не поддерживается'}), 501
+            future = None
+            try:
+                future = asyncio.run_coroutine_threadsafe(self._create_rtc_answer(request.json), self._rtc_loop)
+                return _json_response(future.result(timeout=10))
+            except Exception as e:
+                if future is not None:
+                    # При таймауте согласование отменяется, и соединение закрывается
+                    future.cancel()
+                return _json_response({'error': str(e)}), 500
         
         @app.route('/video')
         def video_feed():
             """Видеопоток MJPEG"""
             def generate():
+                last_seq = 0
                 while self.running:
                     try:
-                        frame_data = self.frame_queue.get(timeout=1.0)
-                        if frame_data is not None:
-                            # Компрессия для быстрой передачи
-                            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 85]
-                            ret, jpeg = cv2.imencode('.jpg', frame_data, encode_param)
-                            if ret:
-                                yield (b'--frame\r\n'
-                                      b'Content-Type: image/jpeg\r\n\r\n' + 
-                                      jpeg.tobytes() + b'\r\n')
-                    except queue.Empty:
-                        # Отправляем пустой кадр при отсутствии данных
-                        continue
+                        # Ожидание нового кадра, уже закодированного общим потоком
+                        with self._jpeg_ready:
+                            self._jpeg_ready.wait_for(lambda: self._latest_jpeg[0] != last_seq, timeout=1.0)
+                            seq, jpeg = self._latest_jpeg
+                        if seq == last_seq:
+                            continue
+                        last_seq = seq
+                        
+                        yield (b'--frame\r\n'
+                              b'Content-Type: image/jpeg\r\n\r\n' + 
+                              jpeg + b'\r\n')
                     except Exception as e:
                         logger.error(f"Ошибка видео потока: {e}")
                         break
@@ -927,12 +1473,10 @@ class ProfessionalYOLOAnnotator:
                 # Создаем временный захват для предпросмотра
                 if camera_index == self.current_camera_index:
                     # Используем основной поток если это текущая камера
-                    with self.frame_lock:
-                        if self.latest_frame is not None:
-                            frame = self.latest_frame.copy()
-                        else:
-                            # Создаем черный кадр если нет данных
-                            frame = np.zeros((240, 320, 3), dtype=np.uint8)
+                    _, frame = self._latest
+                    if frame is None:
+                        # Создаем черный кадр если нет данных
+                        frame = np.zeros((240, 320, 3), dtype=np.uint8)
                 else:
                     # Для других камер создаем отдельный захват
                     temp_cap = cv2.VideoCapture(camera_index)
@@ -946,26 +1490,27 @@ class ProfessionalYOLOAnnotator:
                 
                 # Изменяем размер для миниатюры
                 frame = cv2.resize(frame, (320, 240))
-                ret, jpeg = cv2.imencode('.jpg', frame)
-                return Response(jpeg.tobytes(), mimetype='image/jpeg')
+                return Response(_encode_jpeg(frame, quality=95), mimetype='image/jpeg')
             except Exception as e:
                 # Возвращаем черный кадр при ошибке
                 black_frame = np.zeros((240, 320, 3), dtype=np.uint8)
-                ret, jpeg = cv2.imencode('.jpg', black_frame)
-                return Response(jpeg.tobytes(), mimetype='image/jpeg')
+                return Response(_encode_jpeg(black_frame, quality=95), mimetype='image/jpeg')
         
         @app.route('/api/stats')
         def get_stats():
             """Получение статистики в формате JSON"""
+            now = time.monotonic()
+            cached_at, body = self._stats_cache
+            if body is not None and now - cached_at < self.stats_cache_ttl:
+                return Response(body, mimetype='application/json')
+            
             # Получаем последние объекты
             current_objects = {}
             if hasattr(self, 'prev_objects') and self.prev_objects:
-                current_objects = self.prev_objects
+                current_objects = self.prev_objects.to_dict()
             
-            # Формируем историю обнаружений (последние 50 записей)
-            detection_history = []
-            if self.stats.get('detection_history'):
-                detection_history = self.stats['detection_history'][-50:]
+            # История обнаружений: график показывает последние 20 точек
+            detection_history = self._history_tail(20)
             
             stats_data = {
                 'total_frames': self.stats['total_frames'],
@@ -978,15 +1523,16 @@ class ProfessionalYOLOAnnotator:
                 'recent_detections': self.get_recent_detections(10),
                 'detection_history': detection_history,
                 'is_paused': self.pause_annotation,
-                'queue_size': self.frame_queue.qsize(),
                 'current_camera': self.current_camera_index
             }
-            return jsonify(stats_data)
+            body = _json_bytes(stats_data)
+            self._stats_cache = (now, body)
+            return Response(body, mimetype='application/json')
         
         @app.route('/api/cameras')
         def get_cameras():
             """Получение списка доступных камер"""
-            return jsonify({
+            return _json_response({
                 'cameras': self.available_cameras,
                 'current_camera': self.current_camera_index
             })
@@ -1000,69 +1546,67 @@ class ProfessionalYOLOAnnotator:
                 
                 success = self.switch_camera(camera_index)
                 if success:
-                    return jsonify({'success': True, 'message': f'Камера переключена на {camera_index}'})
+                    return _json_response({'success': True, 'message': f'Камера переключена на {camera_index}'})
                 else:
-                    return jsonify({'success': False, 'error': 'Не удалось переключить камеру'})
+                    return _json_response({'success': False, 'error': 'Не удалось переключить камеру'})
             except Exception as e:
-                return jsonify({'success': False, 'error': str(e)})
+                return _json_response({'success': False, 'error': str(e)})
         
         @app.route('/api/take_snapshot', methods=['POST'])
         def take_snapshot():
             """Создание скриншота"""
             try:
-                with self.frame_lock:
-                    if self.latest_frame is not None:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        filename = f"snapshot_{timestamp}.jpg"
-                        filepath = self.screenshots_dir / filename
-                        
+                # Кадр не изменяется после публикации
+                _, latest_frame = self._latest
+                
+                if latest_frame is not None:
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    filename = f"snapshot_{timestamp}.jpg"
+                    filepath = self.screenshots_dir / filename
+                    
+                    try:
                         # Сохраняем кадр
-                        cv2.imwrite(str(filepath), self.latest_frame)
+                        self.snapshot_queue.put_nowait((filepath, latest_frame, None))
                         
                         # Добавляем аннотации если есть
-                        if self.prev_objects:
-                            annotated_frame = self.latest_frame.copy()
-                            for obj in self.prev_objects.values():
-                                x1, y1, x2, y2 = obj['x1'], obj['y1'], obj['x2'], obj['y2']
-                                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                                cv2.putText(annotated_frame, f"{obj['label']}: {obj['confidence']:.2f}",
-                                           (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                            
+                        prev_objects = self.prev_objects
+                        if prev_objects:
                             annotated_filename = f"snapshot_annotated_{timestamp}.jpg"
                             annotated_filepath = self.screenshots_dir / annotated_filename
-                            cv2.imwrite(str(annotated_filepath), annotated_frame)
-                        
-                        return jsonify({'success': True, 'filename': filename})
-                    else:
-                        return jsonify({'success': False, 'error': 'Нет доступных кадров'})
+                            self.snapshot_queue.put_nowait((annotated_filepath, latest_frame, prev_objects))
+                    except queue.Full:
+                        return _json_response({'success': False, 'error': 'Очередь снимков переполнена'})
+                    
+                    return _json_response({'success': True, 'filename': filename})
+                else:
+                    return _json_response({'success': False, 'error': 'Нет доступных кадров'})
             except Exception as e:
-                return jsonify({'success': False, 'error': str(e)})
+                return _json_response({'success': False, 'error': str(e)})
         
         @app.route('/api/download_annotations')
         def download_annotations():
             """Скачивание аннотаций"""
             if self.annotations:
-                annotations_data = self.prepare_annotations_data()
                 return Response(
-                    json.dumps(annotations_data, indent=2, ensure_ascii=False),
+                    stream_with_context(self.stream_annotations_json()),
                     mimetype='application/json',
                     headers={'Content-Disposition': 'attachment; filename=vision_ai_annotations.json'}
                 )
-            return jsonify({'error': 'No annotations available'}), 404
+            return _json_response({'error': 'No annotations available'}), 404
         
         @app.route('/api/save_session', methods=['POST'])
         def save_session():
             """Сохранение текущей сессии"""
             success = self._save_to_json()
             if success:
-                return jsonify({'message': f'Session saved with {len(self.annotations)} frames'})
-            return jsonify({'error': 'Failed to save session'}), 500
+                return _json_response({'message': f'Session saved with {len(self.annotations)} frames'})
+            return _json_response({'error': 'Failed to save session'}), 500
         
         @app.route('/api/toggle_pause', methods=['POST'])
         def toggle_pause():
             """Переключение паузы"""
             self.pause_annotation = not self.pause_annotation
-            return jsonify({'paused': self.pause_annotation})
+            return _json_response({'paused': self.pause_annotation})
         
         @app.route('/api/update_settings', methods=['POST'])
         def update_settings():
@@ -1074,53 +1618,112 @@ class ProfessionalYOLOAnnotator:
                     pass
                 if 'iou_threshold' in data:
                     self.iou_threshold = float(data['iou_threshold'])
-                return jsonify({'message': 'Settings updated'})
+                if 'auto_save' in data:
+                    self.auto_save = bool(data['auto_save'])
+                return _json_response({'message': 'Settings updated'})
             except Exception as e:
-                return jsonify({'error': str(e)}), 400
+                return _json_response({'error': str(e)}), 400
         
         logger.info(f"🌐 Веб-интерфейс доступен по http://localhost:{self.flask_port}")
         logger.info(f"   📊 Статистика: http://localhost:{self.flask_port}/api/stats")
         logger.info(f"   📥 Аннотации: http://localhost:{self.flask_port}/api/download_annotations")
         
-        app.run(host='0.0.0.0', port=self.flask_port, debug=False, threaded=True, use_reloader=False)
+        if serve is not None:
+            # Каждый MJPEG-поток занимает поток сервера, поэтому пул с запасом
+            serve(app, host='0.0.0.0', port=self.flask_port,
+                  threads=max(8, (os.cpu_count() or 1) * 2), connection_limit=200)
+        else:
+            logger.warning("waitress не установлен, используется встроенный сервер Flask")
+            app.run(host='0.0.0.0', port=self.flask_port, debug=False, threaded=True, use_reloader=False)
+    
+    def _history_tail(self, count):
+        """Последние записи истории обнаружений"""
+        # Обход с конца: читается только count записей, а не вся очередь
+        tail = list(itertools.islice(reversed(self.stats['detection_history']), count))
+        tail.reverse()
+        return tail
     
     def get_recent_detections(self, count=10):
         """Получение последних обнаруженных объектов"""
-        recent = []
-        frames = list(self.annotations.values())[-10:]  # Последние 10 кадров
-        
-        for frame in frames:
-            for obj in frame['objects'].values():
-                recent.append({
-                    'label': obj['label'],
-                    'confidence': round(obj['confidence'] * 100, 1),
-                    'timestamp': frame['timestamp']
-                })
-                if len(recent) >= count:
-                    return recent
-        
-        return recent
+        return list(self._recent_detections)[-count:]
     
-    def calculate_iou(self, box1, box2):
-        """Вычисление IoU"""
-        x1_1, y1_1, x2_1, y2_1 = box1
-        x1_2, y1_2, x2_2, y2_2 = box2
+    def calculate_iou(self, boxes1, boxes2):
+        """Вычисление IoU для пар рамок формы (N, 4)"""
+        boxes1 = np.atleast_2d(np.asarray(boxes1, dtype=np.float64))
+        boxes2 = np.atleast_2d(np.asarray(boxes2, dtype=np.float64))
         
         # Координаты пересечения
-        x_left = max(x1_1, x1_2)
-        y_top = max(y1_1, y1_2)
-        x_right = min(x2_1, x2_2)
-        y_bottom = min(y2_1, y2_2)
+        x_left = np.maximum(boxes1[:, 0], boxes2[:, 0])
+        y_top = np.maximum(boxes1[:, 1], boxes2[:, 1])
+        x_right = np.minimum(boxes1[:, 2], boxes2[:, 2])
+        y_bottom = np.minimum(boxes1[:, 3], boxes2[:, 3])
         
-        if x_right < x_left or y_bottom < y_top:
-            return 0.0
+        intersection = np.clip(x_right - x_left, 0, None) * np.clip(y_bottom - y_top, 0, None)
+        area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+        area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+        union = area1 + area2 - intersection
+        
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    
+    def _add_annotation(self, key, frame_annotation):
+        """Добавление кадра в ограниченное хранилище аннотаций"""
+        replaced = self.annotations.pop(key, None)
+        if replaced is not None:
+            self.stats['total_objects'] -= len(replaced['objects'])
+        
+        self.annotations[key] = frame_annotation
+        self._annotations_version += 1
+        self.stats['total_objects'] += len(frame_annotation['objects'])
+        
+        objects = frame_annotation['objects']
+        for label, conf in zip(objects.labels, objects.conf.tolist()):
+            self._recent_detections.append({
+                'label': label,
+                'confidence': round(conf * 100, 1),
+                'timestamp': frame_annotation['timestamp']
+            })
         
-        intersection_area = (x_right - x_left) * (y_bottom - y_top)
-        box1_area = (x2_1 - x1_1) * (y2_1 - y1_1)
-        box2_area = (x2_2 - x1_2) * (y2_2 - y1_2)
-        union_area = box1_area + box2_area - intersection_area
+        # Журнал хранит все кадры сессии, в памяти - только последние
+        record = {'frame_id': key, **frame_annotation, 'objects': frame_annotation['objects'].to_dict()}
+        self._journal.write(_json_bytes(record) + b'\n')
         
-        return intersection_area / union_area if union_area > 0 else 0
+        # Вытеснение самых старых кадров
+        while len(self.annotations) > self.max_saved_frames:
+            _, evicted = self.annotations.popitem(last=False)
+            self.stats['total_objects'] -= len(evicted['objects'])
+    
+    def _boxes_to_objects(self, data, scale=1.0):
+        """Разбор отфильтрованных по порогу результатов YOLO (строки x1, y1, x2, y2, conf, cls) в FrameObjects"""
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        confs = data[:, 4]
+        cls_ids = data[:, 5].astype(np.int16)
+        xyxy = (data[:, :4] / scale).astype(np.int32)
+        
+        labels = [self.model.names[cls_id] for cls_id in cls_ids.tolist()]
+        # Нумерация внутри класса (в порядке уверенности)
+        seen = Counter()
+        indices = []
+        for label in labels:
+            indices.append(seen[label])
+            seen[label] += 1
+        
+        # Обновление статистики объектов
+        self.stats['object_counts'].update(labels)
+        
+        return FrameObjects(indices, labels, cls_ids, xyxy, confs)
+    
+    def _draw_objects(self, frame, objects, color=(0, 255, 0)):
+        """Отрисовка рамок (одним вызовом OpenCV) и подписей объектов на кадре"""
+        if len(objects):
+            x1, y1, x2, y2 = objects.xyxy.T
+            corners = np.stack([np.stack([x1, y1], 1), np.stack([x2, y1], 1),
+                                np.stack([x2, y2], 1), np.stack([x1, y2], 1)], axis=1)
+            cv2.polylines(frame, list(corners), True, color, 2)
+            
+            for label, (left, top), conf in zip(objects.labels, objects.xyxy[:, :2].tolist(), objects.conf.tolist()):
+                cv2.putText(frame, f"{label}: {conf:.2f}", (left, top - 10),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        return frame
     
     def has_significant_changes(self, current_objects):
         """Проверка на значительные изменения"""
@@ -1133,39 +1736,49 @@ class ProfessionalYOLOAnnotator:
         if len(current_objects) != len(self.prev_objects):
             return True
         
+        # Совпадение подписей - сцена неподвижна, сравнение объектов не требуется
+        if current_objects.signature == self.prev_objects.signature:
+            return False
+        
         # Проверка классов
-        current_labels = set(obj['label'] for obj in current_objects.values())
-        prev_labels = set(obj['label'] for obj in self.prev_objects.values())
-        if current_labels != prev_labels:
+        if set(current_objects.labels) != set(self.prev_objects.labels):
             return True
         
-        # Проверка положения объектов
-        for obj_id, curr_obj in current_objects.items():
-            if obj_id in self.prev_objects:
-                prev_obj = self.prev_objects[obj_id]
-                curr_box = (curr_obj['x1'], curr_obj['y1'], curr_obj['x2'], curr_obj['y2'])
-                prev_box = (prev_obj['x1'], prev_obj['y1'], prev_obj['x2'], prev_obj['y2'])
-                
-                iou = self.calculate_iou(curr_box, prev_box)
-                if iou < self.iou_threshold:
-                    return True
-                
-                # Расстояние между центрами
-                curr_center = ((curr_obj['x1'] + curr_obj['x2']) // 2, 
-                              (curr_obj['y1'] + curr_obj['y2']) // 2)
-                prev_center = ((prev_obj['x1'] + prev_obj['x2']) // 2, 
-                              (prev_obj['y1'] + prev_obj['y2']) // 2)
-                
-                distance = np.sqrt((curr_center[0] - prev_center[0])**2 + 
-                                 (curr_center[1] - prev_center[1])**2)
-                
-                if distance > self.position_threshold:
-                    return True
+        # Проверка положения совпавших объектов. Если id идут в том же порядке
+        # (обычный случай), массивы рамок сравниваются целиком без сопоставления
+        curr_ids, prev_ids = current_objects.ids, self.prev_objects.ids
+        if curr_ids == prev_ids:
+            curr_boxes = current_objects.xyxy
+            prev_boxes = self.prev_objects.xyxy
+        else:
+            prev_index = {obj_id: i for i, obj_id in enumerate(prev_ids)}
+            matches = [(i, prev_index[obj_id]) for i, obj_id in enumerate(curr_ids)
+                       if obj_id in prev_index]
+            if not matches:
+                return False
+            
+            curr_idx, prev_idx = (list(idx) for idx in zip(*matches))
+            curr_boxes = current_objects.xyxy[curr_idx]
+            prev_boxes = self.prev_objects.xyxy[prev_idx]
+        
+        if NUMBA_AVAILABLE or len(curr_boxes) < 4:
+            # Скомпилированный цикл с ранним выходом; без numba - только для нескольких объектов
+            return _boxes_changed(curr_boxes, prev_boxes, self.position_threshold, self.iou_threshold)
         
-        return False
+        iou = self.calculate_iou(curr_boxes, prev_boxes)
+        if (iou < self.iou_threshold).any():
+            return True
+        
+        # Расстояние между центрами
+        curr_centers = (curr_boxes[:, :2] + curr_boxes[:, 2:]) // 2
+        prev_centers = (prev_boxes[:, :2] + prev_boxes[:, 2:]) // 2
+        delta = curr_centers - prev_centers
+        distance = np.hypot(delta[:, 0], delta[:, 1])
+        
+        return bool((distance > self.position_threshold).any())
     
-    def prepare_annotations_data(self):
-        """Подготовка данных аннотаций для экспорта"""
+    def _annotations_header(self):
+        """Метаданные и статистика экспорта (все, кроме кадров)"""
         return {
             'metadata': {
                 'project': 'Vision AI Annotator',
@@ -1182,10 +1795,48 @@ class ProfessionalYOLOAnnotator:
                     'position_threshold': self.position_threshold
                 }
             },
-            'statistics': self.stats,
-            'frames': dict(self.annotations)
+            'statistics': {**self.stats, 'detection_history': list(self.stats['detection_history'])}
         }
     
+    def _iter_frames(self):
+        """Кадры для экспорта в формате словарей"""
+        # Снимок ключей: основной цикл продолжает пополнять хранилище
+        for frame_id, frame in list(self.annotations.items()):
+            yield frame_id, {**frame, 'objects': frame['objects'].to_dict()}
+    
+    def prepare_annotations_data(self):
+        """Подготовка данных аннотаций для экспорта"""
+        data = self._annotations_header()
+        data['frames'] = dict(self._iter_frames())
+        return data
+    
+    def stream_annotations_json(self):
+        """Потоковая выдача аннотаций в JSON по одному кадру"""
+        yield b'{'
+        for key, value in self._annotations_header().items():
+            yield _json_bytes(key) + b':' + _json_bytes(value) + b','
+        yield b'"frames":{'
+        
+        separator = b''
+        for frame_id, frame in self._iter_frames():
+            yield separator + _json_bytes(frame_id) + b':' + _json_bytes(frame)
+            separator = b','
+        yield b'}}'
+    
+    def stream_annotations_msgpack(self):
+        """Потоковая выдача аннотаций в MessagePack по одному кадру (та же структура, что и JSON)"""
+        packer = msgpack.Packer(use_bin_type=True)
+        header = self._annotations_header()
+        # Снимок ключей: размер карты кадров записывается заранее
+        frames = list(self.annotations.items())
+        
+        yield packer.pack_map_header(len(header) + 1)
+        for key, value in header.items():
+            yield packer.pack(key) + packer.pack(value)
+        yield packer.pack('frames') + packer.pack_map_header(len(frames))
+        for frame_id, frame in frames:
+            yield packer.pack(frame_id) + packer.pack({**frame, 'objects': frame['objects'].to_dict()})
+    
     def run(self):
         """Основной цикл обработки"""
         logger.info("🚀 Запуск Vision AI Annotator")
@@ -1197,10 +1848,13 @@ class ProfessionalYOLOAnnotator:
         last_fps_time = time.time()
         fps_frames = 0
         last_history_update = time.time()
+        # Буфер кадра переиспользуется: сырой кадр не покидает итерацию цикла
+        # (в веб-интерфейс уходит отдельный уменьшенный кадр)
+        frame = None
         
         try:
             while self.running:
-                ret, frame = self.cap.read()
+                ret, frame = self.cap.read(frame)
                 if not ret:
                     logger.warning("Не удалось получить кадр с камеры")
                     time.sleep(0.1)
@@ -1218,42 +1872,14 @@ class ProfessionalYOLOAnnotator:
                     last_fps_time = current_time
                 
                 # Детекция объектов (если не на паузе)
-                current_objects = OrderedDict()
+                current_objects = FrameObjects()
                 
                 if not self.pause_annotation:
-                    results = self.model(frame, verbose=False, conf=0.5)
-                    result = results[0]
+                    # Порог уверенности применяет сама модель
+                    result = self.model(frame, verbose=False, conf=0.5)[0]
                     
                     if result.boxes is not None:
-                        boxes = result.boxes.cpu().numpy()
-                        
-                        for i in range(len(boxes)):
-                            box = boxes[i]
-                            conf = box.conf[0]
-                            
-                            if conf > 0.5:
-                                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                                cls_id = int(box.cls[0])
-                                label = self.model.names[cls_id]
-                                
-                                obj_id = f"{label}_{i}_{frame_count}"
-                                
-                                current_objects[obj_id] = {
-                                    'label': label,
-                                    'class_id': cls_id,
-                                    'x1': x1,
-                                    'y1': y1,
-                                    'x2': x2,
-                                    'y2': y2,
-                                    'confidence': float(conf),
-                                    'width': x2 - x1,
-                                    'height': y2 - y1,
-                                    'center_x': (x1 + x2) // 2,
-                                    'center_y': (y1 + y2) // 2
-                                }
-                                
-                                # Обновление статистики объектов
-                                self.stats['object_counts'][label] = self.stats['object_counts'].get(label, 0) + 1
+                        current_objects = self._boxes_to_objects(result.boxes.data.cpu().numpy())
                 
                 # Проверка на сохранение
                 should_save = self.has_significant_changes(current_objects)
@@ -1268,37 +1894,25 @@ class ProfessionalYOLOAnnotator:
                         'objects': current_objects
                     }
                     
-                    self.annotations[f"frame_{saved_frame_count}"] = frame_annotation
-                    
-                    # Автосохранение каждые 10 кадров
-                    if saved_frame_count % 10 == 0:
-                        self._save_to_json()
+                    self._add_annotation(f"frame_{saved_frame_count}", frame_annotation)
                     
-                    self.prev_objects = current_objects.copy()
+                    self.prev_objects = current_objects
                 
                 # Обновление истории обнаружений (каждые 5 секунд)
                 if current_time - last_history_update >= 5:
                     self.stats['detection_history'].append({
                         'timestamp': timestamp,
                         'object_count': len(current_objects),
-                        'objects': list(current_objects.keys())
+                        'objects': list(current_objects.ids)
                     })
-                    # Ограничиваем историю 100 записями
-                    if len(self.stats['detection_history']) > 100:
-                        self.stats['detection_history'] = self.stats['detection_history'][-100:]
                     last_history_update = current_time
                 
                 # Обновление статистики
                 self.stats['total_frames'] = frame_count
                 self.stats['saved_frames'] = saved_frame_count
-                self.stats['total_objects'] = sum(len(frame['objects']) 
-                                                 for frame in self.annotations.values())
                 
-                # Отображение (если не в режиме только веб)
-                if not self.pause_annotation and 'results' in locals():
-                    annotated_frame = results[0].plot()
-                else:
-                    annotated_frame = frame.copy()
+                # Отображение: рисуем прямо в буфере кадра, он больше не нужен в этой итерации
+                annotated_frame = self._draw_objects(frame, current_objects)
                 
                 # Добавление информации на кадр
                 color = (0, 255, 0) if not self.pause_annotation else (0, 0, 255)
@@ -1319,21 +1933,12 @@ class ProfessionalYOLOAnnotator:
                 
                 # Отправка кадра в веб-интерфейс
                 try:
+                    # display_frame создается заново на каждом кадре - копия не нужна
                     display_frame = cv2.resize(annotated_frame, (854, 480))
-                    
-                    if self.frame_queue.full():
-                        try:
-                            self.frame_queue.get_nowait()
-                        except queue.Empty:
-                            pass
-                    
-                    if display_frame is not None:
-                        self.frame_queue.put_nowait(display_frame)
-                        
-                        with self.frame_lock:
-                            self.latest_frame = display_frame.copy()
+                    self._latest = (next(self._frame_seq), display_frame)
+                    self._frame_event.set()
                 except Exception as e:
-                    logger.debug(f"Ошибка очереди кадров: {e}")
+                    logger.debug(f"Ошибка публикации кадра: {e}")
                 
                 # Отображение в локальном окне
                 cv2.imshow('Vision AI Annotator - Local View', annotated_frame)
@@ -1346,9 +1951,9 @@ class ProfessionalYOLOAnnotator:
                 elif key == ord(' '):  # Пробел для паузы
                     self.pause_annotation = not self.pause_annotation
                     logger.info(f"Пауза: {self.pause_annotation}")
-                elif key == ord('s'):  # Принудительное сохранение
-                    self._save_to_json()
-                    logger.info("Принудительное сохранение выполнено")
+                elif key == ord('s'):  # Принудительное сохранение (в фоновом потоке)
+                    self._save_requested.set()
+                    logger.info("Принудительное сохранение запущено")
                 elif key == ord('c'):  # Переключение камеры
                     self.current_camera_index = (self.current_camera_index + 1) % max(len(self.available_cameras), 1)
                     self.switch_camera(self.current_camera_index)
@@ -1379,27 +1984,73 @@ class ProfessionalYOLOAnnotator:
     
     def _save_to_json(self, final=False):
         """Сохранение аннотаций в JSON файл"""
-        try:
-            if self.annotations:
-                annotations_data = self.prepare_annotations_data()
-                
-                filename = self.output_file if final else f"autosave_{self.output_file}"
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(annotations_data, f, indent=2, ensure_ascii=False)
-                
-                if final:
-                    logger.info(f"Финальное сохранение: {len(self.annotations)} кадров в {filename}")
-                else:
-                    logger.debug(f"Автосохранение: {len(self.annotations)} кадров")
+        with self._save_lock:
+            try:
+                if not final and not self._journal.closed:
+                    # Журнал уже содержит новые кадры (дописываются по одному при добавлении):
+                    # сбрасываем его буфер, чтобы точка сохранения включала их независимо от снимка
+                    self._journal.flush()
                 
-                return True
-        except Exception as e:
-            logger.error(f"Ошибка сохранения: {e}")
-        
-        return False
+                if self.annotations:
+                    if final:
+                        filename = str(self.output_file)
+                    else:
+                        # Автосохранения читаются только программами - MessagePack, если доступен
+                        autosave_file = Path(f"autosave_{self.output_file}")
+                        filename = str(autosave_file.with_suffix('.msgpack') if msgpack is not None else autosave_file)
+                    version = self._annotations_version
+                    if self._saved_versions.get(filename) == version:
+                        return True
+                    
+                    # Запись во временный файл и атомарная замена
+                    tmp_filename = f"{filename}.tmp"
+                    try:
+                        if filename.endswith('.gz'):
+                            # Сжатие на лету: повторяющиеся ключи JSON сжимаются в разы, а уровень 3 быстрее записи на диск
+                            out = gzip.open(tmp_filename, 'wb', compresslevel=3)
+                        else:
+                            # Крупный буфер: потоковая запись по кадру уходит на диск блоками по 1 МБ
+                            out = open(tmp_filename, 'wb', buffering=1 << 20)
+                        with out as f:
+                            if final and len(self.annotations) <= self.pretty_save_max_frames:
+                                f.write(_json_bytes(self.prepare_annotations_data(), indent=True))
+                            elif not final and msgpack is not None:
+                                f.writelines(self.stream_annotations_msgpack())
+                            else:
+                                f.writelines(self.stream_annotations_json())
+                        os.replace(tmp_filename, filename)
+                    except Exception:
+                        # Недописанный временный файл не оставляем рядом с сохранением
+                        if os.path.exists(tmp_filename):
+                            os.remove(tmp_filename)
+                        raise
+                    self._saved_versions[filename] = version
+                    
+                    if final:
+                        logger.info(f"Финальное сохранение: {len(self.annotations)} кадров в {filename}")
+                    else:
+                        # Сообщение форматируется лениво: на уровне INFO строка не собирается
+                        logger.debug("Автосохранение: %d кадров", len(self.annotations))
+                    
+                    return True
+            except Exception as e:
+                logger.error(f"Ошибка сохранения: {e}")
+            
+            return False
+
+def parse_args():
+    """Параметры командной строки (значения по умолчанию - из переменных окружения)"""
+    parser = argparse.ArgumentParser(description='Vision AI Annotator - локальная камера')
+    parser.add_argument('--port', type=int, default=os.environ.get('SYSMON_PORT', '3000'),
+                        help='порт веб-интерфейса (SYSMON_PORT, по умолчанию 3000)')
+    parser.add_argument('--output', default='vision_ai_annotations.json',
+                        help='файл аннотаций (с расширением .gz - сжатый)')
+    return parser.parse_args()
 
 def main():
     """Точка входа в приложение"""
+    args = parse_args()
+    
     print("\n" + "="*60)
     print("🚀 VISION AI ANNOTATOR v2.0")
     print("="*60)
@@ -1418,17 +2069,13 @@ def main():
     print("="*60)
     
     try:
-        port = int(input(f"Введите порт для веб-интерфейса [по умолчанию 3000]: ") or "3000")
-        
         annotator = ProfessionalYOLOAnnotator(
-            output_file='vision_ai_annotations.json',
-            flask_port=port
+            output_file=args.output,
+            flask_port=args.port
         )
         
         annotator.run()
         
-    except ValueError:
-        print("Ошибка: порт должен быть числом")
     except Exception as e:
         print(f"Ошибка запуска: {e}")
     finally:
@@ -1,118 +1,250 @@
 import cv2
 import json
+import gzip
+import hashlib
+import importlib.util
 from datetime import datetime
 from pathlib import Path
 from ultralytics import YOLO
-from collections import OrderedDict
+import torch
+from collections import Counter, OrderedDict, deque
 import time
+import itertools
+import math
 import numpy as np
-from flask import Flask, Response, render_template_string, jsonify, request
+from flask import Flask, Response, stream_with_context, request
 import threading
 import queue
 import logging
 import signal
-import sys
 import os
+import argparse
 import base64
 import uuid
+from concurrent.futures import Future
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class WebRTCYOLOAnnotator:
-    def __init__(self, flask_port=3000):
-        """
-        Серверный аннотатор с использованием WebRTC для захвата видео с камеры пользователя
-        """
+# Пулы потоков OpenCV и PyTorch по умолчанию занимают все ядра и конкурируют
+# с потоками веб-сервера. Число потоков инференса: SYSMON_INFERENCE_THREADS
+def _inference_threads():
+    """Число потоков инференса из SYSMON_INFERENCE_THREADS (некорректное значение - по умолчанию)"""
+    default = max(1, (os.cpu_count() or 2) // 2)
+    value = os.environ.get('SYSMON_INFERENCE_THREADS')
+    if value is None:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(f"Некорректное SYSMON_INFERENCE_THREADS={value!r}, используется {default}")
+        return default
+
+INFERENCE_THREADS = _inference_threads()
+cv2.setNumThreads(1)
+torch.set_num_threads(INFERENCE_THREADS)
+# TF32 на тензорных ядрах (Ampere+) для оставшихся FP32 операций
+if hasattr(torch, 'set_float32_matmul_precision'):
+    torch.set_float32_matmul_precision('high')
+else:
+    # torch < 1.12
+    torch.backends.cuda.matmul.allow_tf32 = True
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    
+    # Без numba функции выполняются как обычный Python
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # Запасной C-сериализатор, если orjson не установлен
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    # Компактный двоичный формат для автосохранений
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    # Flask < 2.2 не поддерживает подмену JSON-провайдера
+    DefaultJSONProvider = None
+
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
+
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_420
+    _turbo_jpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    # Нет PyTurboJPEG или самой библиотеки libjpeg-turbo
+    _turbo_jpeg = None
+
+try:
+    # OpenCV, собранный с CUDA, может уменьшать кадры на GPU
+    CV2_CUDA = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    CV2_CUDA = False
+
+def _downscale(frame, size):
+    """Уменьшение кадра (на GPU, если OpenCV собран с CUDA)"""
+    if CV2_CUDA:
+        gpu_frame = cv2.cuda_GpuMat()
+        gpu_frame.upload(frame)
+        return cv2.cuda.resize(gpu_frame, size, interpolation=cv2.INTER_AREA).download()
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+def _dhash(frame):
+    """64-битный разностный хэш (dHash) кадра"""
+    small = cv2.cvtColor(cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), 'big')
+
+def _encode_jpeg(frame, quality=85):
+    """Кодирование кадра в JPEG (libjpeg-turbo, если доступен)"""
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(frame, quality=quality, jpeg_subsample=TJSAMP_420)
+    ok, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return jpeg.tobytes() if ok else None
+
+def _decode_image(data):
+    """Декодирование кадра в BGR (JPEG - через libjpeg-turbo, если доступен)"""
+    if _turbo_jpeg is not None and data[:2] == b'\xff\xd8':
         try:
-            self.model = YOLO('best.pt')
-        except:
-            # Используем стандартную модель YOLOv8 если best.pt не найден
-            self.model = YOLO('yolov8n.pt')
-            logger.warning("Модель best.pt не найдена, используется yolov8n.pt")
-        
-        self.output_file = Path('annotations.json')
-        self.annotations = OrderedDict()
-        
-        # Параметры для оптимизации
-        self.prev_objects = None
-        self.position_threshold = 50
-        self.iou_threshold = 0.3
-        
-        # Очередь для кадров
-        self.frame_queue = queue.Queue(maxsize=10)
-        self.latest_frame = None
-        self.frame_lock = threading.Lock()
-        
-        # Статистика
-        self.stats = {
-            'total_frames': 0,
-            'saved_frames': 0,
-            'total_objects': 0,
-            'fps': 0,
-            'start_time': time.time(),
-            'object_counts': {},
-            'detection_history': [],
-            'active_clients': 0
-        }
-        
-        # Контроль работы
-        self.running = True
-        self.flask_port = flask_port
-        self.pause_annotation = False
-        
-        # Клиенты
-        self.clients = {}
-        
-        # Папки
-        self.screenshots_dir = Path("screenshots")
-        self.screenshots_dir.mkdir(exist_ok=True)
-        
-        # Настройки по умолчанию
-        self.settings = {
-            'confidence': 0.5,
-            'show_boxes': True,
-            'show_labels': True,
-            'show_conf': True,
-            'box_color': '#3b82f6',
-            'text_color': '#ffffff',
-            'box_thickness': 2,
-            'font_size': 12,
-            'save_interval': 300,  # 5 минут
-            'max_fps': 30,
-            'detection_mode': 'balanced'  # fast, balanced, accurate
-        }
-        
-        # Запуск Flask
-        self.flask_thread = threading.Thread(target=self.start_flask_server)
-        self.flask_thread.daemon = True
-        self.flask_thread.start()
-        
-        # Обработка сигналов
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
-        
-        logger.info(f"Сервер запущен на порту: {flask_port}")
+            return _turbo_jpeg.decode(data)
+        except (OSError, ValueError):
+            # Поврежденный JPEG - пробуем OpenCV
+            pass
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+# Кодировщики стандартного json создаются один раз, а не при каждом вызове dumps
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
+_json_encode_indent = json.JSONEncoder(ensure_ascii=False, indent=2).encode
+
+def _json_bytes(obj, indent=False):
+    """Сериализация в JSON (orjson или ujson, если установлены)"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    if ujson is not None:
+        return ujson.dumps(obj, indent=2 if indent else 0, ensure_ascii=False).encode('utf-8')
+    return (_json_encode_indent if indent else _json_encode)(obj).encode('utf-8')
+
+def _csv_field(value):
+    """Экранирование текстового поля CSV (кавычки только при необходимости)"""
+    if any(c in value for c in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+# Разбор JSON тем же сериализатором
+_json_loads = orjson.loads if orjson is not None else ujson.loads if ujson is not None else json.loads
+
+class OrjsonProvider(DefaultJSONProvider or object):
+    """JSON-провайдер Flask на orjson: request.json разбирается без стандартного json"""
     
-    def signal_handler(self, signum, frame):
-        """Обработчик сигналов"""
-        logger.info(f"Получен сигнал {signum}, завершение...")
-        self.running = False
-        self.cleanup()
-        sys.exit(0)
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
     
-    def cleanup(self):
-        """Очистка ресурсов"""
-        self._save_to_json(final=True)
-        logger.info("Ресурсы освобождены")
+    def dumps(self, obj, **kwargs):
+        return _json_bytes(obj).decode('utf-8')
+
+def _json_response(obj):
+    """JSON-ответ Flask без прохода через jsonify"""
+    return Response(_json_bytes(obj), mimetype='application/json')
+
+@njit(cache=True, fastmath=True)
+def _iou_scalar(x11, y11, x21, y21, x12, y12, x22, y22):
+    """IoU двух рамок, заданных координатами"""
+    x_left = max(x11, x12)
+    y_top = max(y11, y12)
+    x_right = min(x21, x22)
+    y_bottom = min(y21, y22)
     
-    def start_flask_server(self):
-        """Запуск Flask сервера"""
-        app = Flask(__name__)
+    if x_right < x_left or y_bottom < y_top:
+        return 0.0
+    
+    intersection = (x_right - x_left) * (y_bottom - y_top)
+    union = (x21 - x11) * (y21 - y11) + (x22 - x12) * (y22 - y12) - intersection
+    return intersection / union if union > 0 else 0.0
+
+@njit(cache=True, fastmath=True)
+def _boxes_changed(curr_boxes, prev_boxes, position_threshold, iou_threshold):
+    """Сдвинулась ли хотя бы одна из сопоставленных рамок формы (N, 4)"""
+    for i in range(curr_boxes.shape[0]):
+        cx1, cy1, cx2, cy2 = curr_boxes[i, 0], curr_boxes[i, 1], curr_boxes[i, 2], curr_boxes[i, 3]
+        px1, py1, px2, py2 = prev_boxes[i, 0], prev_boxes[i, 1], prev_boxes[i, 2], prev_boxes[i, 3]
+        if _iou_scalar(cx1, cy1, cx2, cy2, px1, py1, px2, py2) < iou_threshold:
+            return True
         
-        # Современный HTML интерфейс с Bootstrap 5
-        HTML_PAGE = """
+        distance = math.hypot((cx1 + cx2) // 2 - (px1 + px2) // 2,
+                              (cy1 + cy2) // 2 - (py1 + py2) // 2)
+        if distance > position_threshold:
+            return True
+    return False
+
+class FrameObjects:
+    """Объекты одного кадра, хранящиеся по столбцам в массивах NumPy"""
+    __slots__ = ('index', 'labels', 'cls', 'xyxy', 'conf', '_signature')
+    
+    def __init__(self, index=(), labels=(), cls=(), xyxy=(), conf=()):
+        # Номер объекта среди объектов того же класса; строковые id собираются только при необходимости
+        self.index = np.asarray(index, dtype=np.int16)
+        self.labels = list(labels)
+        self.cls = np.asarray(cls, dtype=np.int16)
+        self.xyxy = np.asarray(xyxy, dtype=np.int32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        self._signature = None
+    
+    def __len__(self):
+        return len(self.labels)
+    
+    @property
+    def signature(self):
+        """Структурная подпись кадра: классы и точные рамки без учета порядка"""
+        if self._signature is None:
+            # Без квантования: совпадение подписей означает IoU = 1 и нулевое смещение
+            rows = np.column_stack((self.cls.astype(np.int32), self.xyxy))
+            self._signature = rows[np.lexsort(rows.T[::-1])].tobytes()
+        return self._signature
+    
+    @property
+    def ids(self):
+        """Идентификаторы объектов вида label_index: не зависят от номера кадра и сопоставимы между кадрами"""
+        return [f"{label}_{i}" for i, label in zip(self.index.tolist(), self.labels)]
+    
+    def to_dict(self):
+        """Преобразование в словарь объектов (формат экспорта)"""
+        objects = OrderedDict()
+        for obj_id, label, cls_id, (x1, y1, x2, y2), conf in zip(
+                self.ids, self.labels, self.cls.tolist(), self.xyxy.tolist(), self.conf.tolist()):
+            objects[obj_id] = {
+                'label': label,
+                'class_id': cls_id,
+                'x1': x1,
+                'y1': y1,
+                'x2': x2,
+                'y2': y2,
+                'confidence': conf
+            }
+        return objects
+
+# Современный HTML интерфейс с Bootstrap 5
+HTML_PAGE = """
 <!DOCTYPE html>
 <html lang="ru">
 <head>
@@ -436,6 +568,20 @@ class WebRTCYOLOAnnotator:
             position: relative;
             height: 200px;
             margin: 1rem 0;
+            /* Размер задан явно - перерисовка графика не затрагивает остальную страницу */
+            contain: strict;
+        }
+        
+        /* Панели, обновляемые каждую секунду, пересчитываются изолированно */
+        #detectionsList, #currentObjects, #objectDistribution, .modal-body {
+            contain: content;
+        }
+        
+        /* Canvas перерисовывается каждый кадр - выносим его в отдельный слой композитора */
+        #webcamCanvas {
+            contain: layout paint;
+            will-change: contents;
+            transform: translateZ(0);
         }
         
         .floating-controls {
@@ -443,6 +589,8 @@ class WebRTCYOLOAnnotator:
             bottom: 2rem;
             right: 2rem;
             z-index: 1000;
+            /* Без paint: тени и анимация кнопок выходят за границы блока */
+            contain: layout style;
         }
         
         .floating-btn {
@@ -457,6 +605,7 @@ class WebRTCYOLOAnnotator:
             transition: all 0.3s ease;
             backdrop-filter: blur(10px);
             border: 1px solid rgba(255, 255, 255, 0.2);
+            will-change: transform;
         }
         
         .floating-btn:hover {
@@ -600,7 +749,7 @@ class WebRTCYOLOAnnotator:
                     <span class="status-indicator status-active" id="statusIndicator"></span>
                     <span id="statusText" class="small fw-medium">Подключение...</span>
                 </div>
-                <button class="btn btn-glass btn-sm" onclick="toggleTheme()" id="themeToggle">
+                <button class="btn btn-glass btn-sm" data-action="toggleTheme" id="themeToggle">
                     <i class="bi bi-moon-stars"></i>
                 </button>
             </div>
@@ -634,22 +783,22 @@ class WebRTCYOLOAnnotator:
                 <!-- Controls -->
                 <div class="row g-3 mb-4">
                     <div class="col-md-3 col-6">
-                        <button class="btn btn-glass-primary w-100 d-flex align-items-center justify-content-center gap-2" onclick="startWebcam()" id="startBtn">
+                        <button class="btn btn-glass-primary w-100 d-flex align-items-center justify-content-center gap-2" data-action="startWebcam" id="startBtn">
                             <i class="bi bi-camera-video"></i> <span>Старт</span>
                         </button>
                     </div>
                     <div class="col-md-3 col-6">
-                        <button class="btn btn-glass w-100 d-flex align-items-center justify-content-center gap-2" onclick="togglePause()" id="pauseBtn">
+                        <button class="btn btn-glass w-100 d-flex align-items-center justify-content-center gap-2" data-action="togglePause" id="pauseBtn">
                             <i class="bi bi-pause-circle"></i> <span>Пауза</span>
                         </button>
                     </div>
                     <div class="col-md-3 col-6">
-                        <button class="btn btn-glass w-100 d-flex align-items-center justify-content-center gap-2" onclick="takeSnapshot()">
+                        <button class="btn btn-glass w-100 d-flex align-items-center justify-content-center gap-2" data-action="takeSnapshot">
                             <i class="bi bi-camera"></i> <span>Снимок</span>
                         </button>
                     </div>
                     <div class="col-md-3 col-6">
-                        <button class="btn btn-glass w-100 d-flex align-items-center justify-content-center gap-2" onclick="saveSession()">
+                        <button class="btn btn-glass w-100 d-flex align-items-center justify-content-center gap-2" data-action="saveSession">
                             <i class="bi bi-save"></i> <span>Сохранить</span>
                         </button>
                     </div>
@@ -900,13 +1049,13 @@ class WebRTCYOLOAnnotator:
                                 </div>
                             </div>
                             <div class="mb-4">
-                                <button class="btn btn-glass w-100 mb-2" onclick="exportAnnotations()">
+                                <button class="btn btn-glass w-100 mb-2" data-action="exportAnnotations">
                                     <i class="bi bi-download"></i> Экспорт аннотаций
                                 </button>
-                                <button class="btn btn-glass w-100 mb-2" onclick="clearAnnotations()">
+                                <button class="btn btn-glass w-100 mb-2" data-action="clearAnnotations">
                                     <i class="bi bi-trash"></i> Очистить аннотации
                                 </button>
-                                <button class="btn btn-glass w-100" onclick="resetStatistics()">
+                                <button class="btn btn-glass w-100" data-action="resetStatistics">
                                     <i class="bi bi-arrow-clockwise"></i> Сбросить статистику
                                 </button>
                             </div>
@@ -915,7 +1064,7 @@ class WebRTCYOLOAnnotator:
                 </div>
                 <div class="modal-footer border-0">
                     <button type="button" class="btn btn-glass" data-bs-dismiss="modal">Отмена</button>
-                    <button type="button" class="btn btn-glass-primary" onclick="applySettings()">Применить настройки</button>
+                    <button type="button" class="btn btn-glass-primary" data-action="applySettings">Применить настройки</button>
                 </div>
             </div>
         </div>
@@ -923,7 +1072,7 @@ class WebRTCYOLOAnnotator:
 
     <!-- Floating Action Buttons -->
     <div class="floating-controls">
-        <button class="floating-btn btn-glass-primary" onclick="downloadAnnotations()" data-bs-toggle="tooltip" title="Экспорт аннотаций">
+        <button class="floating-btn btn-glass-primary" data-action="downloadAnnotations" data-bs-toggle="tooltip" title="Экспорт аннотаций">
             <i class="bi bi-download"></i>
         </button>
         <button class="floating-btn glass" data-bs-toggle="modal" data-bs-target="#settingsModal" title="Настройки">
@@ -943,6 +1092,105 @@ class WebRTCYOLOAnnotator:
         let isProcessing = false;
         let clientId = null;
         let frameInterval = null;
+        let renderFrameId = null;
+        let videoFrameId = null;
+        // Последние полученные аннотации: перерисовываются на каждом кадре, пока не придут новые
+        let lastAnnotations = [];
+        // Увеличивается при каждой смене аннотаций или их оформления
+        let annotationsVersion = 0;
+        // Настройки отправляются с кадром, только если сервер еще не знает текущую версию
+        let settingsVersion = 0;
+        let serverSettingsVersion = -1;
+        let sentSettingsVersion = -1;
+        // Отдельный canvas для захвата кадра, чтобы отправка не зависела от отрисовки.
+        // OffscreenCanvas кодирует JPEG асинхронно, не блокируя отрисовку
+        const captureCanvas = typeof OffscreenCanvas !== 'undefined'
+            ? new OffscreenCanvas(1, 1) : document.createElement('canvas');
+        const captureCtx = captureCanvas.getContext('2d');
+        
+        function encodeCapture() {
+            if (captureCanvas.convertToBlob) {
+                return captureCanvas.convertToBlob({ type: 'image/jpeg', quality: 0.8 });
+            }
+            return new Promise(resolve => captureCanvas.toBlob(resolve, 'image/jpeg', 0.8));
+        }
+        
+        // Кодирование и отправка кадра в Web Worker: основной поток только рисует.
+        // Воркер создается из строки, поэтому адрес API передается абсолютным
+        const PROCESS_FRAME_URL = new URL('/api/process_frame', location.href).href;
+        const CAPTURE_WORKER_SRC = `
+            let canvas = null;
+            let ctx = null;
+            self.onmessage = async (e) => {
+                const { bitmap, url, clientId, settings, settingsVersion } = e.data;
+                try {
+                    if (!canvas || canvas.width !== bitmap.width || canvas.height !== bitmap.height) {
+                        canvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+                        ctx = canvas.getContext('2d');
+                    }
+                    ctx.drawImage(bitmap, 0, 0);
+                    bitmap.close();
+                    
+                    const blob = await canvas.convertToBlob({ type: 'image/jpeg', quality: 0.8 });
+                    const headers = {
+                        'Content-Type': 'image/jpeg',
+                        'X-Client-Id': clientId,
+                        'X-Settings-Version': String(settingsVersion)
+                    };
+                    if (settings) {
+                        headers['X-Settings'] = JSON.stringify(settings);
+                    }
+                    
+                    const response = await fetch(url, { method: 'POST', body: blob, headers });
+                    self.postMessage(await response.json());
+                } catch (error) {
+                    self.postMessage({ success: false, error: String(error) });
+                }
+            };
+        `;
+        let captureWorker = null;
+        if (typeof Worker !== 'undefined' && typeof OffscreenCanvas !== 'undefined'
+                && typeof createImageBitmap !== 'undefined') {
+            try {
+                const workerUrl = URL.createObjectURL(new Blob([CAPTURE_WORKER_SRC], { type: 'text/javascript' }));
+                captureWorker = new Worker(workerUrl);
+                captureWorker.onmessage = (e) => {
+                    handleFrameResult(e.data);
+                    isProcessing = false;
+                };
+                captureWorker.onerror = (e) => {
+                    console.error('Capture worker error:', e.message);
+                    isProcessing = false;
+                };
+            } catch (error) {
+                captureWorker = null;
+            }
+        }
+        
+        // Ссылки на элементы страницы ищутся один раз при загрузке
+        const D = {};
+        function initDomRefs() {
+            [
+                'objectsChart', 'performanceChart', 'confidenceSlider', 'confidenceValue',
+                'confidencePercent', 'fpsSlider', 'fpsValue', 'detectionMode', 'autoSave',
+                'boxColor', 'boxColorText', 'textColor', 'textColorText', 'boxThickness',
+                'thicknessValue', 'fontSize', 'fontValue', 'showBoxes', 'showLabels',
+                'showConfidence', 'iouSlider', 'iouValue', 'motionSlider', 'motionValue',
+                'saveInterval', 'webcamVideo', 'startBtn', 'webcamCanvas', 'currentObjects',
+                'detectionCount', 'totalFrames', 'savedFrames', 'totalObjects', 'activeClients',
+                'fpsDisplay', 'statusIndicator', 'statusText', 'pauseBtn', 'detectionsList',
+                'objectDistribution', 'exportFormat', 'includeImages', 'includeMetadata',
+                'includeStatistics', 'settingsModal', 'themeToggle'
+            ].forEach(id => { D[id] = document.getElementById(id); });
+        }
+        
+        // Кнопки с data-action обслуживаются одним делегированным обработчиком
+        const actions = {
+            toggleTheme, startWebcam, togglePause, takeSnapshot,
+            saveSession, exportAnnotations, clearAnnotations, resetStatistics,
+            applySettings, downloadAnnotations
+        };
+        
         let charts = {};
         let settings = {
             confidence: 0.5,
@@ -961,27 +1209,35 @@ class WebRTCYOLOAnnotator:
             saveInterval: 300
         };
         
+        // Форматтеры времени создаются один раз вместо разбора опций при каждом вызове
+        const TIME_FMT = new Intl.DateTimeFormat('ru-RU', { hour: '2-digit', minute: '2-digit' });
+        const TIME_FMT_S = new Intl.DateTimeFormat('ru-RU', { hour: '2-digit', minute: '2-digit', second: '2-digit' });
+        
         // Chart colors
         const chartColorsDark = {
             primary: 'rgba(59, 130, 246, 0.5)',
+            primaryBorder: 'rgba(59, 130, 246, 1)',
             secondary: 'rgba(147, 51, 234, 0.5)',
             success: 'rgba(34, 197, 94, 0.5)',
+            successBorder: 'rgba(34, 197, 94, 1)',
             grid: 'rgba(255, 255, 255, 0.1)',
             text: 'rgba(248, 250, 252, 0.8)'
         };
         
         const chartColorsLight = {
             primary: 'rgba(30, 64, 175, 0.5)',
+            primaryBorder: 'rgba(30, 64, 175, 1)',
             secondary: 'rgba(124, 58, 237, 0.5)',
             success: 'rgba(21, 128, 61, 0.5)',
+            successBorder: 'rgba(21, 128, 61, 1)',
             grid: 'rgba(0, 0, 0, 0.1)',
             text: 'rgba(30, 41, 59, 0.8)'
         };
         
         // Initialize charts
         function initCharts() {
-            const objectsCtx = document.getElementById('objectsChart').getContext('2d');
-            const perfCtx = document.getElementById('performanceChart').getContext('2d');
+            const objectsCtx = D.objectsChart.getContext('2d');
+            const perfCtx = D.performanceChart.getContext('2d');
             
             const colors = document.documentElement.getAttribute('data-bs-theme') === 'dark' 
                 ? chartColorsDark : chartColorsLight;
@@ -993,7 +1249,7 @@ class WebRTCYOLOAnnotator:
                     datasets: [{
                         label: 'Объекты',
                         data: [],
-                        borderColor: colors.primary.replace('0.5', '1'),
+                        borderColor: colors.primaryBorder,
                         backgroundColor: colors.primary,
                         borderWidth: 2,
                         tension: 0.4,
@@ -1025,7 +1281,7 @@ class WebRTCYOLOAnnotator:
                     datasets: [{
                         label: 'FPS',
                         data: [],
-                        borderColor: colors.success.replace('0.5', '1'),
+                        borderColor: colors.successBorder,
                         backgroundColor: colors.success,
                         borderWidth: 2,
                         tension: 0.4,
@@ -1057,7 +1313,7 @@ class WebRTCYOLOAnnotator:
                 ? chartColorsDark : chartColorsLight;
             
             if (charts.objects) {
-                charts.objects.data.datasets[0].borderColor = colors.primary.replace('0.5', '1');
+                charts.objects.data.datasets[0].borderColor = colors.primaryBorder;
                 charts.objects.data.datasets[0].backgroundColor = colors.primary;
                 charts.objects.options.scales.y.grid.color = colors.grid;
                 charts.objects.options.scales.y.ticks.color = colors.text;
@@ -1065,7 +1321,7 @@ class WebRTCYOLOAnnotator:
             }
             
             if (charts.performance) {
-                charts.performance.data.datasets[0].borderColor = colors.success.replace('0.5', '1');
+                charts.performance.data.datasets[0].borderColor = colors.successBorder;
                 charts.performance.data.datasets[0].backgroundColor = colors.success;
                 charts.performance.options.scales.y.grid.color = colors.grid;
                 charts.performance.options.scales.y.ticks.color = colors.text;
@@ -1082,43 +1338,84 @@ class WebRTCYOLOAnnotator:
             updateSettingsUI();
         }
         
-        // Save settings to localStorage
+        // Save settings to localStorage: серия изменений сводится к одной синхронной записи
+        let saveSettingsTimer = null;
         function saveSettings() {
+            clearTimeout(saveSettingsTimer);
+            saveSettingsTimer = setTimeout(flushSettings, 300);
+        }
+        
+        function flushSettings() {
+            saveSettingsTimer = null;
             localStorage.setItem('visionai_settings', JSON.stringify(settings));
         }
         
-        // Update settings UI
+        // Подписи ползунков и цветов обновляются не чаще одного раза за кадр
+        const LIVE_LABELS = [
+            ['confidenceSlider', v => {
+                D.confidenceValue.textContent = (+v).toFixed(2);
+                D.confidencePercent.textContent = Math.round(v * 100) + '%';
+            }],
+            ['fpsSlider', v => { D.fpsValue.textContent = v; }],
+            ['boxThickness', v => { D.thicknessValue.textContent = v; }],
+            ['fontSize', v => { D.fontValue.textContent = v; }],
+            ['iouSlider', v => { D.iouValue.textContent = (+v).toFixed(2); }],
+            ['motionSlider', v => { D.motionValue.textContent = v; }],
+            ['boxColor', v => { D.boxColorText.textContent = v; }],
+            ['textColor', v => { D.textColorText.textContent = v; }]
+        ];
+        
+        function bindLiveLabels() {
+            LIVE_LABELS.forEach(([id, render]) => {
+                let rafId = null;
+                D[id].addEventListener('input', () => {
+                    if (rafId) return;
+                    rafId = requestAnimationFrame(() => {
+                        rafId = null;
+                        render(D[id].value);
+                    });
+                });
+            });
+        }
+        
+        // Update settings UI: все записи в DOM выполняются одним пакетом в кадре анимации.
+        // Чтения layout (offsetWidth и т.п.) здесь недопустимы - они вызовут синхронный пересчет
+        let settingsUIPending = null;
         function updateSettingsUI() {
-            // Update sliders and values
-            document.getElementById('confidenceSlider').value = settings.confidence;
-            document.getElementById('confidenceValue').textContent = settings.confidence.toFixed(2);
-            document.getElementById('confidencePercent').textContent = Math.round(settings.confidence * 100) + '%';
-            
-            document.getElementById('fpsSlider').value = settings.fps;
-            document.getElementById('fpsValue').textContent = settings.fps;
-            
-            document.getElementById('detectionMode').value = settings.detectionMode;
-            document.getElementById('autoSave').checked = settings.autoSave;
-            
-            // Visual settings
-            document.getElementById('boxColor').value = settings.boxColor;
-            document.getElementById('boxColorText').textContent = settings.boxColor;
-            document.getElementById('textColor').value = settings.textColor;
-            document.getElementById('textColorText').textContent = settings.textColor;
-            document.getElementById('boxThickness').value = settings.boxThickness;
-            document.getElementById('thicknessValue').textContent = settings.boxThickness;
-            document.getElementById('fontSize').value = settings.fontSize;
-            document.getElementById('fontValue').textContent = settings.fontSize;
-            document.getElementById('showBoxes').checked = settings.showBoxes;
-            document.getElementById('showLabels').checked = settings.showLabels;
-            document.getElementById('showConfidence').checked = settings.showConfidence;
-            
-            // Advanced settings
-            document.getElementById('iouSlider').value = settings.iouThreshold;
-            document.getElementById('iouValue').textContent = settings.iouThreshold.toFixed(2);
-            document.getElementById('motionSlider').value = settings.motionThreshold;
-            document.getElementById('motionValue').textContent = settings.motionThreshold;
-            document.getElementById('saveInterval').value = settings.saveInterval;
+            if (settingsUIPending) return;
+            settingsUIPending = requestAnimationFrame(() => {
+                settingsUIPending = null;
+                // Update sliders and values
+                D.confidenceSlider.value = settings.confidence;
+                D.confidenceValue.textContent = settings.confidence.toFixed(2);
+                D.confidencePercent.textContent = Math.round(settings.confidence * 100) + '%';
+                
+                D.fpsSlider.value = settings.fps;
+                D.fpsValue.textContent = settings.fps;
+                
+                D.detectionMode.value = settings.detectionMode;
+                D.autoSave.checked = settings.autoSave;
+                
+                // Visual settings
+                D.boxColor.value = settings.boxColor;
+                D.boxColorText.textContent = settings.boxColor;
+                D.textColor.value = settings.textColor;
+                D.textColorText.textContent = settings.textColor;
+                D.boxThickness.value = settings.boxThickness;
+                D.thicknessValue.textContent = settings.boxThickness;
+                D.fontSize.value = settings.fontSize;
+                D.fontValue.textContent = settings.fontSize;
+                D.showBoxes.checked = settings.showBoxes;
+                D.showLabels.checked = settings.showLabels;
+                D.showConfidence.checked = settings.showConfidence;
+                
+                // Advanced settings
+                D.iouSlider.value = settings.iouThreshold;
+                D.iouValue.textContent = settings.iouThreshold.toFixed(2);
+                D.motionSlider.value = settings.motionThreshold;
+                D.motionValue.textContent = settings.motionThreshold;
+                D.saveInterval.value = settings.saveInterval;
+            });
         }
         
         // Generate client ID
@@ -1144,13 +1441,13 @@ class WebRTCYOLOAnnotator:
                 };
                 
                 cameraStream = await navigator.mediaDevices.getUserMedia(constraints);
-                const video = document.getElementById('webcamVideo');
+                const video = D.webcamVideo;
                 video.srcObject = cameraStream;
                 
                 // Update UI
-                document.getElementById('startBtn').innerHTML = '<i class="bi bi-stop-circle"></i> <span>Стоп</span>';
-                document.getElementById('startBtn').classList.remove('btn-glass-primary');
-                document.getElementById('startBtn').classList.add('btn-danger');
+                D.startBtn.innerHTML = '<i class="bi bi-stop-circle"></i> <span>Стоп</span>';
+                D.startBtn.classList.remove('btn-glass-primary');
+                D.startBtn.classList.add('btn-danger');
                 
                 // Generate client ID
                 clientId = generateClientId();
@@ -1177,14 +1474,24 @@ class WebRTCYOLOAnnotator:
                     clearInterval(frameInterval);
                     frameInterval = null;
                 }
+                if (renderFrameId) {
+                    cancelAnimationFrame(renderFrameId);
+                    renderFrameId = null;
+                }
+                if (videoFrameId) {
+                    D.webcamVideo.cancelVideoFrameCallback(videoFrameId);
+                    videoFrameId = null;
+                }
+                lastAnnotations = [];
+                annotationsVersion++;
                 
                 // Update UI
-                document.getElementById('startBtn').innerHTML = '<i class="bi bi-camera-video"></i> <span>Старт</span>';
-                document.getElementById('startBtn').classList.remove('btn-danger');
-                document.getElementById('startBtn').classList.add('btn-glass-primary');
+                D.startBtn.innerHTML = '<i class="bi bi-camera-video"></i> <span>Старт</span>';
+                D.startBtn.classList.remove('btn-danger');
+                D.startBtn.classList.add('btn-glass-primary');
                 
                 // Clear canvas
-                const canvas = document.getElementById('webcamCanvas');
+                const canvas = D.webcamCanvas;
                 const ctx = canvas.getContext('2d');
                 ctx.clearRect(0, 0, canvas.width, canvas.height);
             }
@@ -1192,52 +1499,108 @@ class WebRTCYOLOAnnotator:
         
         // Start frame processing
         function startFrameProcessing() {
-            const video = document.getElementById('webcamVideo');
-            const canvas = document.getElementById('webcamCanvas');
+            const video = D.webcamVideo;
+            const canvas = D.webcamCanvas;
             const ctx = canvas.getContext('2d');
             
+            // Canvas перерисовывается, только если пришел новый кадр видео или новые аннотации.
+            // Без requestVideoFrameCallback каждый кадр анимации считается новым кадром видео
+            const hasFrameCallback = 'requestVideoFrameCallback' in video;
+            let videoFrameReady = true;
+            let drawnVersion = -1;
+            if (hasFrameCallback) {
+                // Захват для детекции тоже идет по приходу кадров, с прореживанием до settings.fps
+                let lastSent = 0;
+                if (videoFrameId) video.cancelVideoFrameCallback(videoFrameId);
+                const onVideoFrame = (now) => {
+                    videoFrameReady = true;
+                    if (now - lastSent >= 1000 / settings.fps && !isProcessing) {
+                        lastSent = now;
+                        processFrame(video);
+                    }
+                    videoFrameId = video.requestVideoFrameCallback(onVideoFrame);
+                };
+                videoFrameId = video.requestVideoFrameCallback(onVideoFrame);
+            }
+            
             video.onloadedmetadata = () => {
-                canvas.width = video.videoWidth;
-                canvas.height = video.videoHeight;
+                canvas.width = captureCanvas.width = video.videoWidth;
+                canvas.height = captureCanvas.height = video.videoHeight;
+                videoFrameReady = true;
             };
             
-            // Set processing interval based on settings
-            const interval = 1000 / settings.fps;
+            // Отрисовка видео синхронизирована с обновлением экрана и не ждет ответа сервера
+            if (renderFrameId) cancelAnimationFrame(renderFrameId);
+            const render = () => {
+                if (video.readyState >= video.HAVE_CURRENT_DATA
+                        && (videoFrameReady || drawnVersion !== annotationsVersion)) {
+                    videoFrameReady = !hasFrameCallback;
+                    drawnVersion = annotationsVersion;
+                    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+                    if (settings.showBoxes && lastAnnotations.length) {
+                        drawBoundingBoxes(ctx, lastAnnotations);
+                    }
+                }
+                renderFrameId = requestAnimationFrame(render);
+            };
+            renderFrameId = requestAnimationFrame(render);
+            
+            // Без requestVideoFrameCallback детекция идет по таймеру с частотой из настроек;
+            // isProcessing только исключает перекрывающиеся запросы
             if (frameInterval) clearInterval(frameInterval);
+            frameInterval = null;
+            if (hasFrameCallback) return;
+            
+            const interval = 1000 / settings.fps;
             frameInterval = setInterval(() => {
                 if (video.readyState === video.HAVE_ENOUGH_DATA && !isProcessing) {
-                    processFrame(video, canvas, ctx);
+                    processFrame(video);
                 }
             }, interval);
         }
         
         // Process frame
-        async function processFrame(video, canvas, ctx) {
+        async function processFrame(video) {
             isProcessing = true;
+            sentSettingsVersion = settingsVersion;
+            const frameSettings = serverSettingsVersion !== settingsVersion ? settings : null;
             
-            ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+            if (captureWorker) {
+                try {
+                    // ImageBitmap передается воркеру без копирования; флаг снимается по ответу воркера
+                    const bitmap = await createImageBitmap(video);
+                    captureWorker.postMessage({
+                        bitmap, url: PROCESS_FRAME_URL, clientId,
+                        settings: frameSettings, settingsVersion: sentSettingsVersion
+                    }, [bitmap]);
+                } catch (error) {
+                    console.error('Frame capture error:', error);
+                    isProcessing = false;
+                }
+                return;
+            }
             
-            const imageData = canvas.toDataURL('image/jpeg', 0.8);
+            captureCtx.drawImage(video, 0, 0, captureCanvas.width, captureCanvas.height);
             
             try {
+                // JPEG отправляется телом запроса как есть, без base64 и multipart
+                const blob = await encodeCapture();
+                const headers = {
+                    'Content-Type': 'image/jpeg',
+                    'X-Client-Id': clientId,
+                    'X-Settings-Version': String(sentSettingsVersion)
+                };
+                if (frameSettings) {
+                    headers['X-Settings'] = JSON.stringify(frameSettings);
+                }
+                
                 const response = await fetch('/api/process_frame', {
                     method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        image: imageData,
-                        client_id: clientId,
-                        settings: settings
-                    })
+                    body: blob,
+                    headers
                 });
                 
-                const data = await response.json();
-                
-                if (data.success) {
-                    if (settings.showBoxes && data.annotations) {
-                        drawBoundingBoxes(ctx, data.annotations);
-                    }
-                    updateCurrentObjects(data.annotations || []);
-                }
+                handleFrameResult(await response.json());
             } catch (error) {
                 console.error('Frame processing error:', error);
             } finally {
@@ -1245,195 +1608,339 @@ class WebRTCYOLOAnnotator:
             }
         }
         
+        // Результат детекции только обновляет кэш аннотаций, отрисовка идет в цикле rAF
+        function handleFrameResult(data) {
+            if (data.success) {
+                serverSettingsVersion = data.settings_stale ? -1 : sentSettingsVersion;
+                lastAnnotations = data.annotations || [];
+                annotationsVersion++;
+                updateCurrentObjects(lastAnnotations);
+            } else if (data.error) {
+                console.error('Frame processing error:', data.error);
+            }
+        }
+        
+        // Ширина подписи зависит только от шрифта и текста - кэшируем измерения.
+        // Строка шрифта собирается заново и кэш сбрасывается только при смене размера
+        const labelWidthCache = new Map();
+        let labelFontSize = null;
+        let labelFont = null;
+        
+        function labelFontFor(fontSize) {
+            if (fontSize !== labelFontSize) {
+                labelFontSize = fontSize;
+                labelFont = `bold ${fontSize}px Segoe UI`;
+                labelWidthCache.clear();
+            }
+            return labelFont;
+        }
+        
         // Draw bounding boxes
         function drawBoundingBoxes(ctx, annotations) {
+            // Все рамки собираются в один путь и рисуются одним вызовом stroke()
+            const boxes = new Path2D();
+            for (const { x1, y1, x2, y2 } of annotations) {
+                boxes.rect(x1, y1, x2 - x1, y2 - y1);
+            }
             ctx.lineWidth = settings.boxThickness;
-            annotations.forEach(ann => {
-                const { x1, y1, x2, y2, label, confidence } = ann;
-                
-                // Draw box
-                ctx.strokeStyle = settings.boxColor;
-                ctx.strokeRect(x1, y1, x2 - x1, y2 - y1);
+            ctx.strokeStyle = settings.boxColor;
+            ctx.stroke(boxes);
+            
+            if (!settings.showLabels) return;
+            
+            const labelHeight = settings.fontSize + 10;
+            // Шрифт задается на каждом кадре: изменение размера canvas сбрасывает состояние контекста
+            ctx.font = labelFontFor(settings.fontSize);
+            
+            // Подложки подписей - второй общий путь, текст рисуется после одной заливки
+            const backgrounds = new Path2D();
+            const labels = [];
+            for (const { x1, y1, label, confidence } of annotations) {
+                let text = label;
+                if (settings.showConfidence) {
+                    text += ` ${(confidence * 100).toFixed(0)}%`;
+                }
                 
-                // Draw label if enabled
-                if (settings.showLabels) {
-                    ctx.fillStyle = 'rgba(15, 23, 42, 0.8)';
-                    let text = label;
-                    if (settings.showConfidence) {
-                        text += ` ${(confidence * 100).toFixed(0)}%`;
+                let textWidth = labelWidthCache.get(text);
+                if (textWidth === undefined) {
+                    textWidth = ctx.measureText(text).width;
+                    if (labelWidthCache.size > 500) {
+                        labelWidthCache.clear();
                     }
-                    ctx.font = `bold ${settings.fontSize}px Segoe UI`;
-                    const textWidth = ctx.measureText(text).width;
-                    
-                    ctx.fillRect(x1, y1 - (settings.fontSize + 10), textWidth + 10, settings.fontSize + 10);
-                    ctx.fillStyle = settings.textColor;
-                    ctx.fillText(text, x1 + 5, y1 - 5);
+                    labelWidthCache.set(text, textWidth);
                 }
-            });
+                
+                backgrounds.rect(x1, y1 - labelHeight, textWidth + 10, labelHeight);
+                labels.push([text, x1 + 5, y1 - 5]);
+            }
+            
+            ctx.fillStyle = 'rgba(15, 23, 42, 0.8)';
+            ctx.fill(backgrounds);
+            ctx.fillStyle = settings.textColor;
+            for (const [text, x, y] of labels) {
+                ctx.fillText(text, x, y);
+            }
         }
         
         // Update current objects display
         function updateCurrentObjects(annotations) {
-            const container = document.getElementById('currentObjects');
             const count = annotations.length;
             
-            document.getElementById('detectionCount').textContent = count;
+            setText(D.detectionCount, String(count));
             
+            let html;
             if (count === 0) {
-                container.innerHTML = '<span class="text-muted">Объекты не обнаружены</span>';
-                return;
-            }
-            
-            const classCounts = {};
-            annotations.forEach(ann => {
-                classCounts[ann.label] = (classCounts[ann.label] || 0) + 1;
-            });
-            
-            let html = '';
-            for (const [label, count] of Object.entries(classCounts)) {
-                html += `<span class="object-badge">${label}: ${count}</span>`;
+                html = '<span class="text-muted">Объекты не обнаружены</span>';
+            } else {
+                const classCounts = {};
+                annotations.forEach(ann => {
+                    classCounts[ann.label] = (classCounts[ann.label] || 0) + 1;
+                });
+                
+                // Сортировка делает строку независимой от порядка объектов в ответе
+                html = Object.entries(classCounts).sort()
+                    .map(([label, count]) => `<span class="object-badge">${label}: ${count}</span>`)
+                    .join('');
             }
             
-            container.innerHTML = html;
+            setHTML(D.currentObjects, html);
         }
         
         // Update statistics
         async function updateStats() {
             try {
                 const response = await fetch('/api/stats');
-                const data = await response.json();
-                
-                // Update stats
-                document.getElementById('totalFrames').textContent = data.total_frames.toLocaleString();
-                document.getElementById('savedFrames').textContent = data.saved_frames.toLocaleString();
-                document.getElementById('totalObjects').textContent = data.total_objects.toLocaleString();
-                document.getElementById('activeClients').textContent = data.active_clients || 0;
-                document.getElementById('fpsDisplay').textContent = data.fps.toFixed(1);
-                
-                // Update status
-                const indicator = document.getElementById('statusIndicator');
-                const statusText = document.getElementById('statusText');
-                
-                if (data.is_paused) {
-                    indicator.className = 'status-indicator status-paused';
-                    statusText.textContent = 'Пауза';
-                    document.getElementById('pauseBtn').innerHTML = '<i class="bi bi-play-circle"></i> <span>Продолжить</span>';
-                } else {
-                    indicator.className = 'status-indicator status-active';
-                    statusText.textContent = 'Активно';
-                    document.getElementById('pauseBtn').innerHTML = '<i class="bi bi-pause-circle"></i> <span>Пауза</span>';
-                }
-                
-                // Update detections list
-                updateDetectionsList(data.recent_detections || []);
-                
-                // Update object distribution
-                updateObjectDistribution(data.object_counts || {});
-                
-                // Update charts
-                updateCharts(data);
-                
+                scheduleStatsRender(await response.json());
             } catch (error) {
                 console.error('Stats update error:', error);
             }
         }
         
+        // Статистика приходит через Server-Sent Events только при изменениях.
+        // При ошибке соединение переоткрывается с экспоненциальной задержкой
+        let statsSource = null;
+        let statsRetryDelay = 1000;
+        function connectStatsStream() {
+            statsSource = new EventSource('/api/stats/stream');
+            statsSource.onopen = () => {
+                statsRetryDelay = 1000;
+            };
+            statsSource.onmessage = (e) => {
+                scheduleStatsRender(JSON.parse(e.data));
+            };
+            statsSource.onerror = () => {
+                // Пока поток недоступен (например, лимит потоков на сервере), данные берутся опросом
+                statsSource.close();
+                updateStats();
+                setTimeout(connectStatsStream, statsRetryDelay);
+                statsRetryDelay = Math.min(statsRetryDelay * 2, 30000);
+            };
+        }
+        
+        // Все изменения DOM и графиков за тик статистики применяются одним кадром
+        let statsPending = null;
+        let statsData = null;
+        function scheduleStatsRender(data) {
+            statsData = data;
+            if (statsPending) return;
+            statsPending = requestAnimationFrame(() => {
+                statsPending = null;
+                applyStatsDom(statsData);
+                updateCharts(statsData);
+            });
+        }
+        
+        // Apply statistics to the page
+        function applyStatsDom(data) {
+            // Update stats
+            D.totalFrames.textContent = data.total_frames.toLocaleString();
+            D.savedFrames.textContent = data.saved_frames.toLocaleString();
+            D.totalObjects.textContent = data.total_objects.toLocaleString();
+            D.activeClients.textContent = data.active_clients || 0;
+            D.fpsDisplay.textContent = data.fps.toFixed(1);
+            
+            // Update status
+            const indicator = D.statusIndicator;
+            const statusText = D.statusText;
+            
+            if (data.is_paused) {
+                indicator.className = 'status-indicator status-paused';
+                statusText.textContent = 'Пауза';
+                D.pauseBtn.innerHTML = '<i class="bi bi-play-circle"></i> <span>Продолжить</span>';
+            } else {
+                indicator.className = 'status-indicator status-active';
+                statusText.textContent = 'Активно';
+                D.pauseBtn.innerHTML = '<i class="bi bi-pause-circle"></i> <span>Пауза</span>';
+            }
+            
+            // Update detections list
+            updateDetectionsList(data.recent_detections || []);
+            
+            // Update object distribution
+            updateObjectDistribution(data.object_counts || {});
+        }
+        
         // Update charts
         function updateCharts(data) {
-            const timeLabel = new Date().toLocaleTimeString('ru-RU', { hour: '2-digit', minute: '2-digit' });
+            const timeLabel = TIME_FMT.format(new Date());
             
+            // Без анимации - графики обновляются каждую секунду
             if (charts.objects) {
-                charts.objects.data.labels.push(timeLabel);
-                charts.objects.data.datasets[0].data.push(data.total_objects);
-                
-                if (charts.objects.data.labels.length > 15) {
-                    charts.objects.data.labels.shift();
-                    charts.objects.data.datasets[0].data.shift();
-                }
-                
-                charts.objects.update();
+                pushChartPoint(charts.objects, timeLabel, data.total_objects);
+                charts.objects.update('none');
             }
             
             if (charts.performance) {
-                charts.performance.data.labels.push(timeLabel);
-                charts.performance.data.datasets[0].data.push(data.fps);
-                
-                if (charts.performance.data.labels.length > 15) {
-                    charts.performance.data.labels.shift();
-                    charts.performance.data.datasets[0].data.shift();
-                }
-                
-                charts.performance.update();
+                pushChartPoint(charts.performance, timeLabel, data.fps);
+                charts.performance.update('none');
             }
         }
         
-        // Update detections list
-        function updateDetectionsList(detections) {
-            const list = document.getElementById('detectionsList');
+        // Скользящее окно точек графика: лишние точки удаляются одним splice
+        const CHART_POINTS = 15;
+        function pushChartPoint(chart, label, value) {
+            const labels = chart.data.labels;
+            const values = chart.data.datasets[0].data;
+            labels.push(label);
+            values.push(value);
             
-            if (detections.length === 0) {
-                list.innerHTML = `
-                    <div class="empty-state">
-                        <i class="bi bi-eye-slash"></i>
-                        <p class="mb-0">Нет обнаружений</p>
-                    </div>
-                `;
-                return;
+            const excess = labels.length - CHART_POINTS;
+            if (excess > 0) {
+                labels.splice(0, excess);
+                values.splice(0, excess);
             }
+        }
+        
+        // Строки панелей создаются один раз и переиспользуются: на каждом тике
+        // меняются только текст и ширина полос, без пересоздания разметки
+        const DETECTION_ROWS = 5;
+        let detectionRows = null;
+        const distributionRows = new Map();
+        
+        function setText(el, text) {
+            if (el.textContent !== text) el.textContent = text;
+        }
+        
+        // Разметка заменяется только если она отличается от последней записанной
+        const renderedHtml = new WeakMap();
+        function setHTML(el, html) {
+            if (renderedHtml.get(el) === html) return;
+            renderedHtml.set(el, html);
+            el.innerHTML = html;
+        }
+        
+        function emptyState(container, html) {
+            let empty = container.querySelector(':scope > .empty-state');
+            if (!empty) {
+                container.insertAdjacentHTML('afterbegin', html);
+                empty = container.firstElementChild;
+            }
+            return empty;
+        }
+        
+        // Update detections list
+        function updateDetectionsList(detections) {
+            const list = D.detectionsList;
+            const empty = emptyState(list, `
+                <div class="empty-state">
+                    <i class="bi bi-eye-slash"></i>
+                    <p class="mb-0">Нет обнаружений</p>
+                </div>
+            `);
             
-            let html = '';
-            detections.slice(-5).reverse().forEach(detection => {
-                const time = new Date(detection.timestamp).toLocaleTimeString('ru-RU');
-                html += `
-                    <div class="detection-item fade-in">
+            if (!detectionRows) {
+                detectionRows = [];
+                for (let i = 0; i < DETECTION_ROWS; i++) {
+                    const row = document.createElement('div');
+                    row.className = 'detection-item';
+                    row.innerHTML = `
                         <div>
-                            <span class="fw-medium">${detection.label}</span>
-                            <div class="small text-muted">${detection.confidence}% уверенности</div>
+                            <span class="fw-medium"></span>
+                            <div class="small text-muted"></div>
                         </div>
-                        <span class="text-muted small">${time}</span>
-                    </div>
-                `;
-            });
+                        <span class="text-muted small"></span>
+                    `;
+                    row.style.display = 'none';
+                    list.appendChild(row);
+                    detectionRows.push({
+                        row,
+                        label: row.querySelector('.fw-medium'),
+                        confidence: row.querySelector('div.small'),
+                        time: row.querySelector(':scope > span')
+                    });
+                }
+            }
             
-            list.innerHTML = html;
+            const recent = detections.slice(-DETECTION_ROWS).reverse();
+            empty.style.display = recent.length ? 'none' : '';
+            
+            detectionRows.forEach((refs, i) => {
+                const detection = recent[i];
+                refs.row.style.display = detection ? '' : 'none';
+                if (!detection) return;
+                
+                setText(refs.label, detection.label);
+                setText(refs.confidence, `${detection.confidence}% уверенности`);
+                setText(refs.time, TIME_FMT_S.format(new Date(detection.timestamp)));
+            });
         }
         
         // Update object distribution
         function updateObjectDistribution(objectCounts) {
-            const container = document.getElementById('objectDistribution');
-            
-            if (Object.keys(objectCounts).length === 0) {
-                container.innerHTML = `
-                    <div class="empty-state py-3">
-                        <p class="mb-0 small text-muted">Нет данных</p>
-                    </div>
-                `;
-                return;
-            }
+            const container = D.objectDistribution;
+            const empty = emptyState(container, `
+                <div class="empty-state py-3">
+                    <p class="mb-0 small text-muted">Нет данных</p>
+                </div>
+            `);
             
-            let html = '';
-            const sorted = Object.entries(objectCounts)
+            const entries = Object.entries(objectCounts);
+            const total = entries.reduce((sum, [, count]) => sum + count, 0) || 1;
+            const sorted = entries
                 .sort((a, b) => b[1] - a[1])
                 .slice(0, 5);
+            empty.style.display = sorted.length ? 'none' : '';
             
-            sorted.forEach(([label, count]) => {
-                const total = Object.values(objectCounts).reduce((a, b) => a + b, 0);
-                const percentage = total > 0 ? (count / total) * 100 : 0;
-                
-                html += `
-                    <div class="mb-3 fade-in">
+            // Строки классов, выпавших из топа, удаляются
+            const visible = new Set(sorted.map(([label]) => label));
+            distributionRows.forEach((refs, label) => {
+                if (!visible.has(label)) {
+                    refs.row.remove();
+                    distributionRows.delete(label);
+                }
+            });
+            
+            sorted.forEach(([label, count], i) => {
+                let refs = distributionRows.get(label);
+                if (!refs) {
+                    const row = document.createElement('div');
+                    row.className = 'mb-3 fade-in';
+                    row.innerHTML = `
                         <div class="d-flex justify-content-between mb-1">
-                            <span class="small">${label}</span>
-                            <span class="small fw-medium">${count}</span>
+                            <span class="small"></span>
+                            <span class="small fw-medium"></span>
                         </div>
                         <div class="progress-bar-custom">
-                            <div class="progress-custom" style="width: ${percentage}%"></div>
+                            <div class="progress-custom"></div>
                         </div>
-                    </div>
-                `;
+                    `;
+                    refs = {
+                        row,
+                        count: row.querySelector('.fw-medium'),
+                        bar: row.querySelector('.progress-custom')
+                    };
+                    row.querySelector('.small').textContent = label;
+                    distributionRows.set(label, refs);
+                }
+                
+                // Узел перемещается только при изменении порядка (первый дочерний - заглушка)
+                if (container.children[i + 1] !== refs.row) {
+                    container.insertBefore(refs.row, container.children[i + 1] || null);
+                }
+                setText(refs.count, String(count));
+                const width = `${(count / total) * 100}%`;
+                if (refs.bar.style.width !== width) refs.bar.style.width = width;
             });
-            
-            container.innerHTML = html;
         }
         
         // Toggle pause
@@ -1465,10 +1972,10 @@ class WebRTCYOLOAnnotator:
         // Export annotations with custom format
         async function exportAnnotations() {
             try {
-                const format = document.getElementById('exportFormat').value;
-                const includeImages = document.getElementById('includeImages').checked;
-                const includeMetadata = document.getElementById('includeMetadata').checked;
-                const includeStatistics = document.getElementById('includeStatistics').checked;
+                const format = D.exportFormat.value;
+                const includeImages = D.includeImages.checked;
+                const includeMetadata = D.includeMetadata.checked;
+                const includeStatistics = D.includeStatistics.checked;
                 
                 const response = await fetch('/api/export_annotations', {
                     method: 'POST',
@@ -1532,7 +2039,7 @@ class WebRTCYOLOAnnotator:
         
         // Take snapshot
         function takeSnapshot() {
-            const canvas = document.getElementById('webcamCanvas');
+            const canvas = D.webcamCanvas;
             const link = document.createElement('a');
             link.download = `snapshot_${Date.now()}.png`;
             link.href = canvas.toDataURL();
@@ -1543,39 +2050,36 @@ class WebRTCYOLOAnnotator:
         // Apply settings
         async function applySettings() {
             try {
+                const previousFps = settings.fps;
+                
                 // Basic settings
-                settings.confidence = parseFloat(document.getElementById('confidenceSlider').value);
-                settings.fps = parseInt(document.getElementById('fpsSlider').value);
-                settings.detectionMode = document.getElementById('detectionMode').value;
-                settings.autoSave = document.getElementById('autoSave').checked;
+                settings.confidence = parseFloat(D.confidenceSlider.value);
+                settings.fps = parseInt(D.fpsSlider.value);
+                settings.detectionMode = D.detectionMode.value;
+                settings.autoSave = D.autoSave.checked;
                 
                 // Visual settings
-                settings.boxColor = document.getElementById('boxColor').value;
-                settings.textColor = document.getElementById('textColor').value;
-                settings.boxThickness = parseInt(document.getElementById('boxThickness').value);
-                settings.fontSize = parseInt(document.getElementById('fontSize').value);
-                settings.showBoxes = document.getElementById('showBoxes').checked;
-                settings.showLabels = document.getElementById('showLabels').checked;
-                settings.showConfidence = document.getElementById('showConfidence').checked;
+                settings.boxColor = D.boxColor.value;
+                settings.textColor = D.textColor.value;
+                settings.boxThickness = parseInt(D.boxThickness.value);
+                settings.fontSize = parseInt(D.fontSize.value);
+                settings.showBoxes = D.showBoxes.checked;
+                settings.showLabels = D.showLabels.checked;
+                settings.showConfidence = D.showConfidence.checked;
                 
                 // Advanced settings
-                settings.iouThreshold = parseFloat(document.getElementById('iouSlider').value);
-                settings.motionThreshold = parseInt(document.getElementById('motionSlider').value);
-                settings.saveInterval = parseInt(document.getElementById('saveInterval').value);
+                settings.iouThreshold = parseFloat(D.iouSlider.value);
+                settings.motionThreshold = parseInt(D.motionSlider.value);
+                settings.saveInterval = parseInt(D.saveInterval.value);
                 
                 // Update UI values
-                document.getElementById('confidenceValue').textContent = settings.confidence.toFixed(2);
-                document.getElementById('confidencePercent').textContent = Math.round(settings.confidence * 100) + '%';
-                document.getElementById('fpsValue').textContent = settings.fps;
-                document.getElementById('boxColorText').textContent = settings.boxColor;
-                document.getElementById('textColorText').textContent = settings.textColor;
-                document.getElementById('thicknessValue').textContent = settings.boxThickness;
-                document.getElementById('fontValue').textContent = settings.fontSize;
-                document.getElementById('iouValue').textContent = settings.iouThreshold.toFixed(2);
-                document.getElementById('motionValue').textContent = settings.motionThreshold;
+                updateSettingsUI();
                 
                 // Save to localStorage
                 saveSettings();
+                settingsVersion++;
+                // Оформление рамок могло измениться - перерисовать оверлей
+                annotationsVersion++;
                 
                 // Send to server
                 await fetch('/api/update_settings', {
@@ -1584,15 +2088,15 @@ class WebRTCYOLOAnnotator:
                     body: JSON.stringify(settings)
                 });
                 
-                // Restart frame processing if camera is running
-                if (cameraStream) {
+                // Перезапуск цикла обработки нужен только при изменении частоты кадров
+                if (cameraStream && settings.fps !== previousFps) {
                     if (frameInterval) {
                         clearInterval(frameInterval);
                     }
                     startFrameProcessing();
                 }
                 
-                const modal = bootstrap.Modal.getInstance(document.getElementById('settingsModal'));
+                const modal = bootstrap.Modal.getInstance(D.settingsModal);
                 modal.hide();
                 
                 showToast('Настройки применены', 'success');
@@ -1645,7 +2149,7 @@ class WebRTCYOLOAnnotator:
             localStorage.setItem('theme', newTheme);
             
             // Update button icon
-            const btn = document.getElementById('themeToggle');
+            const btn = D.themeToggle;
             btn.innerHTML = newTheme === 'dark' ? 
                 '<i class="bi bi-moon-stars"></i>' : 
                 '<i class="bi bi-sun"></i>';
@@ -1675,12 +2179,21 @@ class WebRTCYOLOAnnotator:
         
         // Initialize
         document.addEventListener('DOMContentLoaded', () => {
+            initDomRefs();
+            
+            document.addEventListener('click', (e) => {
+                const target = e.target.closest('[data-action]');
+                if (target && actions[target.dataset.action]) {
+                    actions[target.dataset.action]();
+                }
+            });
+            
             // Load saved theme
             const savedTheme = localStorage.getItem('theme') || 'dark';
             document.documentElement.setAttribute('data-bs-theme', savedTheme);
             
             // Update theme button
-            const themeBtn = document.getElementById('themeToggle');
+            const themeBtn = D.themeToggle;
             themeBtn.innerHTML = savedTheme === 'dark' ? 
                 '<i class="bi bi-moon-stars"></i>' : 
                 '<i class="bi bi-sun"></i>';
@@ -1688,8 +2201,20 @@ class WebRTCYOLOAnnotator:
             // Load settings
             loadSettings();
             
-            // Initialize charts
-            initCharts();
+            // Графики создаются при первом появлении в области видимости;
+            // до этого updateCharts ничего не делает
+            if ('IntersectionObserver' in window) {
+                const chartsObserver = new IntersectionObserver((entries) => {
+                    if (entries.some(entry => entry.isIntersecting)) {
+                        chartsObserver.disconnect();
+                        initCharts();
+                    }
+                });
+                chartsObserver.observe(D.objectsChart.parentElement);
+                chartsObserver.observe(D.performanceChart.parentElement);
+            } else {
+                initCharts();
+            }
             
             // Update glass effects
             updateGlassEffects();
@@ -1698,228 +2223,630 @@ class WebRTCYOLOAnnotator:
             const tooltips = document.querySelectorAll('[data-bs-toggle="tooltip"]');
             tooltips.forEach(tooltip => new bootstrap.Tooltip(tooltip));
             
-            // Update stats every second
-            setInterval(updateStats, 1000);
+            // Статистика: поток событий, в старых браузерах - опрос раз в секунду
+            if ('EventSource' in window) {
+                connectStatsStream();
+            } else {
+                setInterval(updateStats, 1000);
+            }
             
             // Auto-save if enabled
             if (settings.autoSave) {
                 setInterval(saveSession, settings.saveInterval * 1000);
             }
             
-            // Color picker events
-            document.getElementById('boxColor').addEventListener('input', (e) => {
-                document.getElementById('boxColorText').textContent = e.target.value;
-            });
-            
-            document.getElementById('textColor').addEventListener('input', (e) => {
-                document.getElementById('textColorText').textContent = e.target.value;
-            });
+            // Slider and color picker labels
+            bindLiveLabels();
             
             // Cleanup on page unload
             window.addEventListener('beforeunload', () => {
+                if (saveSettingsTimer) {
+                    clearTimeout(saveSettingsTimer);
+                    flushSettings();
+                }
+                if (statsSource) {
+                    statsSource.close();
+                }
                 if (cameraStream) {
                     cameraStream.getTracks().forEach(track => track.stop());
                 }
                 if (frameInterval) {
                     clearInterval(frameInterval);
                 }
+                if (renderFrameId) {
+                    cancelAnimationFrame(renderFrameId);
+                }
             });
         });
     </script>
 </body>
 </html>
 """
+
+# Страница статична - кодируется и сжимается один раз при импорте
+_INDEX_HTML = HTML_PAGE.encode('utf-8')
+_INDEX_GZ = gzip.compress(_INDEX_HTML, 9)
+
+class WebRTCYOLOAnnotator:
+    def __init__(self, flask_port=3000, flask_host='0.0.0.0', output_file='annotations.json'):
+        """
+        Серверный аннотатор с использованием WebRTC для захвата видео с камеры пользователя
+        """
+        self.max_batch = 8
+        # Режим детекции определяет размер входа модели
+        # (кадры уменьшаются до него заранее средствами OpenCV)
+        self.mode_imgsz = {'fast': 416, 'balanced': 640, 'accurate': 832}
+        self.model, self.model_format = self._load_model()
+        self.mode_presets = self._build_mode_presets()
+        # Готовые словари аргументов модели по ключу - без сборки на каждый пакет
+        self.mode_args = {args_key: dict(args_key) for _, args_key in self.mode_presets.values()}
+        self._warmup_model()
+        # Компиляция numba до первого кадра
+        _iou_scalar(0, 0, 1, 1, 0, 0, 1, 1)
+        _boxes_changed(np.zeros((1, 4), np.int32), np.zeros((1, 4), np.int32), 50, 0.3)
+        
+        self.output_file = Path(output_file)
+        self.annotations = OrderedDict()
+        # Защищает аннотации, счетчики кадров и prev_objects от одновременных запросов
+        self.annotations_lock = threading.Lock()
+        # Ограничение числа хранимых кадров (старые вытесняются)
+        self.max_saved_frames = 10000
+        # Финальное сохранение с отступами собирается в памяти целиком только до этого числа кадров,
+        # больше - пишется потоком по кадру, как автосохранение
+        self.pretty_save_max_frames = 1000
+        # Версия хранилища аннотаций и версии, уже записанные в файлы
+        self._annotations_version = 0
+        self._saved_versions = {}
+        # Сохранения выполняются по одному: иначе более старая версия может заменить более новую
+        self._save_lock = threading.Lock()
+        # Журнал аннотаций в формате JSON Lines: одна строка на сохраненный кадр
+        self.journal_file = self.output_file.with_suffix('.jsonl')
+        self._journal = open(self.journal_file, 'ab', buffering=1 << 20)
+        # Буфер журнала сбрасывается на диск раз в journal_flush_interval секунд фоновым потоком.
+        # Каждая запись - один вызов write, поэтому сброс происходит только на границе записей
+        self.journal_flush_interval = 1.0
+        # Последние обнаружения и кэш ответа /api/stats
+        self._recent_detections = deque(maxlen=32)
+        self.stats_cache_ttl = 0.2
+        self._stats_cache = (0.0, None, None)
+        # Поток статистики: минимальный интервал между событиями и интервал keepalive (секунды)
+        self.stats_stream_interval = 0.25
+        self.stats_keepalive = 15
+        # Поколение статистики: увеличивается при каждом изменении и будит потоки SSE
+        self._stats_generation = 0
+        self.stats_changed = threading.Condition()
+        # Каждый поток SSE занимает рабочий поток сервера до отключения вкладки:
+        # их число ограничено, а пул расширен на этот запас, чтобы обработка кадров
+        # не ждала свободного потока
+        self.max_stats_streams = 8
+        self._stats_streams = 0
+        
+        # Параметры для оптимизации
+        self.prev_objects = None
+        self.position_threshold = 50
+        self.iou_threshold = 0.3
+        # Число различающихся бит dHash (из 64), ниже которого кадр считается неизменным
+        self.hash_threshold = 3
+        
+        # Последний полученный кадр (для снимков): кортеж (номер, кадр)
+        self._frame_seq = itertools.count(1)
+        self._latest = (0, None)
+        
+        # Пакетный инференс: кадры всех клиентов собираются в один вызов модели
+        self.batch_timeout_ms = 5
+        # Предельное время ожидания результата: запрос не зависает, если поток инференса остановлен
+        self.inference_timeout = 5
+        self.inference_queue = queue.Queue()
+        
+        # Статистика
+        self.stats = {
+            'total_frames': 0,
+            'saved_frames': 0,
+            'total_objects': 0,
+            'fps': 0,
+            'start_time': time.time(),
+            'object_counts': Counter(),
+            'detection_history': deque(maxlen=600),
+            'active_clients': 0
+        }
+        
+        # Контроль работы: событие будит основной и фоновые потоки при остановке
+        self.running = True
+        self._stop_event = threading.Event()
+        self.flask_port = flask_port
+        self.flask_host = flask_host
+        self.pause_annotation = False
+        
+        # Клиенты
+        self.clients = OrderedDict()
+        self.clients_lock = threading.Lock()
+        self.client_timeout = 30
+        # Период фоновой очистки неактивных клиентов (секунды)
+        self.client_sweep_interval = 15
+        # Текущий FPS (сглаженный) пересчитывается раз в несколько кадров
+        self.fps_window = 10
+        # Пауза между кадрами дольше этой (секунды) начинает окно заново, чтобы простой не занижал FPS
+        self.fps_idle_gap = 1.0
+        self._fps_frames = 0
+        self._fps_last_t = 0.0
+        self._fps_prev_t = float('-inf')
+        
+        # Папки
+        self.screenshots_dir = Path("screenshots")
+        self.screenshots_dir.mkdir(exist_ok=True)
+        
+        # Настройки по умолчанию
+        self.settings = {
+            'confidence': 0.5,
+            'show_boxes': True,
+            'show_labels': True,
+            'show_conf': True,
+            'box_color': '#3b82f6',
+            'text_color': '#ffffff',
+            'box_thickness': 2,
+            'font_size': 12,
+            'save_interval': 300,  # 5 минут
+            'max_fps': 30,
+            'detection_mode': 'balanced'  # fast, balanced, accurate
+        }
+        
+        # Поток инференса
+        self.inference_thread = threading.Thread(target=self._inference_worker)
+        self.inference_thread.daemon = True
+        self.inference_thread.start()
+        
+        # Запись снимков
+        # Ограниченная очередь: при лавине запросов снимки отклоняются, а не копятся в памяти
+        self.snapshot_queue = queue.Queue(maxsize=16)
+        self.snapshot_thread = threading.Thread(target=self._snapshot_worker)
+        self.snapshot_thread.daemon = True
+        self.snapshot_thread.start()
+        
+        # Очистка неактивных клиентов
+        self.sweep_thread = threading.Thread(target=self._client_sweeper)
+        self.sweep_thread.daemon = True
+        self.sweep_thread.start()
+        
+        # Периодический сброс журнала
+        self.journal_thread = threading.Thread(target=self._journal_flusher)
+        self.journal_thread.daemon = True
+        self.journal_thread.start()
+        
+        # Запуск Flask
+        self.flask_thread = threading.Thread(target=self.start_flask_server)
+        self.flask_thread.daemon = True
+        self.flask_thread.start()
+        
+        # Обработка сигналов
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+        
+        logger.info(f"Сервер запущен на порту: {flask_port}")
+    
+    def signal_handler(self, signum, frame):
+        """Обработчик сигналов"""
+        logger.info(f"Получен сигнал {signum}, завершение...")
+        # Очистку выполняет run() после пробуждения
+        self.stop()
+    
+    def stop(self):
+        """Остановка основного цикла и фоновых потоков"""
+        self.running = False
+        self._stop_event.set()
+    
+    def cleanup(self):
+        """Очистка ресурсов"""
+        self._save_to_json(final=True)
+        self._close_journal()
+        logger.info("Ресурсы освобождены")
+    
+    def _close_journal(self):
+        """Сброс журнала аннотаций на диск"""
+        if not self._journal.closed:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+    
+    def _load_model(self):
+        """Загрузка модели и однократный экспорт в TensorRT (GPU) или OpenVINO (CPU)"""
+        try:
+            model = YOLO('best.pt')
+        except:
+            # Используем стандартную модель YOLOv8 если best.pt не найден
+            model = YOLO('yolov8n.pt')
+            logger.warning("Модель best.pt не найдена, используется yolov8n.pt")
+        
+        weights = Path(model.ckpt_path)
+        # Набор данных для INT8-калибровки (необязательный)
+        calib = weights.with_name('calib.yaml')
+        
+        try:
+            # FP16 TensorRT имеет смысл только на GPU с тензорными ядрами (Volta+)
+            if torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 7:
+                # Профиль строится под наибольший размер входа, чтобы подошли все режимы.
+                # NMS в движок не встраивается: встроенный NMS фиксирует IoU и режим классов
+                # на этапе экспорта, а у режимов детекции они разные (см. _build_mode_presets)
+                export_args = {'format': 'engine', 'half': True, 'dynamic': True,
+                               'batch': self.max_batch, 'imgsz': max(self.mode_imgsz.values())}
+                if calib.exists():
+                    export_args.update(int8=True, data=str(calib))
+                # Профиль экспорта входит в имя файла: движки с другими параметрами
+                # (в том числе от script_1.py) не подхватываются по ошибке
+                engine = weights.with_name(f"{weights.stem}_dyn_b{self.max_batch}_{export_args['imgsz']}"
+                                           f"{'_int8' if calib.exists() else ''}.engine")
+                if not engine.exists():
+                    logger.info("Экспорт модели в TensorRT...")
+                    os.replace(model.export(**export_args), engine)
+                logger.info(f"Используется TensorRT модель: {engine}")
+                return YOLO(str(engine), task='detect'), 'engine'
+            
+            if calib.exists() and importlib.util.find_spec('openvino'):
+                # Динамическая форма входа: режимы работают с разными размерами, а кадры
+                # приходят пакетами. Профиль входит в имя каталога (суффикс _openvino_model
+                # нужен Ultralytics для определения формата)
+                openvino_dir = weights.with_name(f"{weights.stem}_int8_dyn_openvino_model")
+                if not openvino_dir.exists():
+                    logger.info("Экспорт модели в OpenVINO INT8...")
+                    os.replace(model.export(format='openvino', int8=True, dynamic=True, data=str(calib)),
+                               openvino_dir)
+                logger.info(f"Используется OpenVINO модель: {openvino_dir}")
+                return YOLO(str(openvino_dir), task='detect'), 'openvino'
+        except Exception as e:
+            logger.warning(f"Экспорт модели не удался, используется {weights.name}: {e}")
+        
+        return model, 'pt'
+    
+    def _warmup_model(self, runs=3):
+        """Прогрев модели, чтобы первый кадр не платил за инициализацию"""
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        for _ in range(runs):
+            self.model(dummy, verbose=False)
+    
+    def _inference_worker(self):
+        """Пакетная обработка кадров от всех клиентов"""
+        if hasattr(os, 'sched_setaffinity'):
+            # Поток инференса (и создаваемые им потоки PyTorch) закрепляется за частью ядер
+            cpus = sorted(os.sched_getaffinity(0))
+            if INFERENCE_THREADS < len(cpus):
+                os.sched_setaffinity(0, cpus[:INFERENCE_THREADS])
+        
+        while self.running:
+            try:
+                jobs = [self.inference_queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            
+            # Добираем кадры, пришедшие в пределах окна ожидания. С одним клиентом
+            # ждать некого - забираем только то, что уже стоит в очереди
+            wait = self.batch_timeout_ms / 1000 if len(self.clients) > 1 else 0
+            deadline = time.monotonic() + wait
+            while len(jobs) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        jobs.append(self.inference_queue.get(timeout=remaining))
+                    else:
+                        jobs.append(self.inference_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            # В один вызов попадают только кадры с одинаковыми параметрами модели
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job[1], []).append(job)
+            
+            for args_key, group in groups.items():
+                try:
+                    # Порог берется минимальный, каждый клиент фильтрует по своему
+                    min_conf = min(job[2] for job in group)
+                    results = self.model([job[0] for job in group], conf=min_conf, **self.mode_args[args_key])
+                    for job, result in zip(group, results):
+                        job[3].set_result(result)
+                except Exception as e:
+                    for job in group:
+                        if not job[3].done():
+                            job[3].set_exception(e)
+    
+    def _snapshot_worker(self):
+        """Кодирование и запись снимков в фоне, чтобы не задерживать ответ"""
+        while self.running or not self.snapshot_queue.empty():
+            try:
+                filepath, frame = self.snapshot_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            try:
+                jpeg = _encode_jpeg(frame, quality=90)
+                if jpeg is not None:
+                    filepath.write_bytes(jpeg)
+            except Exception as e:
+                logger.error(f"Ошибка записи снимка {filepath}: {e}")
+    
+    def _client_sweeper(self):
+        """Периодическое удаление неактивных клиентов вне обработки запросов"""
+        while not self._stop_event.wait(self.client_sweep_interval):
+            cutoff = time.time() - self.client_timeout
+            with self.clients_lock:
+                # Клиенты упорядочены по активности - неактивные всегда в начале
+                while self.clients and next(iter(self.clients.values()))['last_activity'] < cutoff:
+                    self.clients.popitem(last=False)
+                idle = not self.clients and self.stats['fps'] != 0
+                if idle:
+                    # Кадры больше не приходят - прежнее значение FPS устарело
+                    self.stats['fps'] = 0
+            if idle:
+                self._notify_stats(invalidate=True)
+    
+    def _journal_flusher(self):
+        """Периодический сброс журнала аннотаций на диск"""
+        while not self._stop_event.wait(self.journal_flush_interval):
+            try:
+                self._journal.flush()
+            except ValueError:
+                # Журнал уже закрыт при завершении работы
+                break
+    
+    def _predict(self, frame, confidence, args_key):
+        """Постановка кадра в очередь пакетного инференса и ожидание результата"""
+        future = Future()
+        self.inference_queue.put((frame, args_key, confidence, future))
+        return future.result(timeout=self.inference_timeout)
+    
+    def _build_mode_presets(self):
+        """Параметры модели для каждого режима детекции: (imgsz, ключ аргументов)"""
+        presets = {}
+        for mode, imgsz in self.mode_imgsz.items():
+            model_args = {'verbose': False, 'imgsz': imgsz}
+            if mode == 'fast':
+                # Быстрый режим - FP16 на GPU. TensorRT-движок уже собран в FP16/INT8,
+                # OpenVINO и PyTorch без CUDA работают на CPU как есть
+                if self.model_format == 'pt' and torch.cuda.is_available():
+                    model_args['half'] = True
+            elif mode == 'accurate':
+                model_args['iou'] = 0.3
+                model_args['agnostic_nms'] = True
+            # Отсортированный кортеж служит ключом группировки в пакетном инференсе
+            presets[mode] = (imgsz, tuple(sorted(model_args.items())))
+        return presets
+    
+    def start_flask_server(self):
+        """Запуск Flask сервера"""
+        app = Flask(__name__)
+        if orjson is not None and DefaultJSONProvider is not None:
+            # request.json и jsonify через orjson
+            app.json = OrjsonProvider(app)
         
         @app.route('/')
         def index():
-            return render_template_string(HTML_PAGE)
+            headers = {'Cache-Control': 'public, max-age=3600', 'Vary': 'Accept-Encoding'}
+            if 'gzip' in request.accept_encodings:
+                headers['Content-Encoding'] = 'gzip'
+                return Response(_INDEX_GZ, mimetype='text/html', headers=headers)
+            return Response(_INDEX_HTML, mimetype='text/html', headers=headers)
         
         @app.route('/api/process_frame', methods=['POST'])
         def process_frame():
             """Обработка кадра от клиента"""
             try:
-                data = request.json
-                image_data = data['image']
-                client_id = data.get('client_id', 'unknown')
-                client_settings = data.get('settings', {})
-                
-                # Обновление информации о клиенте
-                self.clients[client_id] = {
-                    'last_activity': time.time(),
-                    'frame_count': self.clients.get(client_id, {}).get('frame_count', 0) + 1
-                }
+                if request.mimetype in ('image/jpeg', 'application/octet-stream'):
+                    # Сырой JPEG в теле запроса, параметры - в заголовках
+                    img_bytes = request.get_data(cache=False)
+                    client_id = request.headers.get('X-Client-Id', 'unknown')
+                    raw_settings = request.headers.get('X-Settings')
+                    client_settings = _json_loads(raw_settings) if raw_settings is not None else None
+                    settings_version = request.headers.get('X-Settings-Version')
+                elif 'frame' in request.files:
+                    # Бинарный JPEG в multipart/form-data
+                    img_bytes = request.files['frame'].read()
+                    client_id = request.form.get('client_id', 'unknown')
+                    raw_settings = request.form.get('settings')
+                    client_settings = _json_loads(raw_settings) if raw_settings is not None else None
+                    settings_version = request.form.get('settings_version')
+                else:
+                    # Совместимость со старыми клиентами: base64 внутри JSON
+                    data = _json_loads(request.get_data())
+                    image_data = data['image']
+                    if ',' in image_data:
+                        image_data = image_data.split(',')[1]
+                    img_bytes = base64.b64decode(image_data)
+                    client_id = data.get('client_id', 'unknown')
+                    client_settings = data.get('settings')
+                    settings_version = data.get('settings_version')
                 
-                # Очистка неактивных клиентов
+                # Обновление информации о клиенте (клиенты упорядочены по последней активности)
                 current_time = time.time()
-                inactive = [cid for cid, client in self.clients.items() 
-                           if current_time - client['last_activity'] > 30]
-                for cid in inactive:
-                    del self.clients[cid]
+                with self.clients_lock:
+                    client_info = self.clients.setdefault(client_id, {'frame_count': 0})
+                    client_info['last_activity'] = current_time
+                    client_info['frame_count'] += 1
+                    self.clients.move_to_end(client_id)
+                    
+                    # Настройки приходят только при смене версии, иначе берутся из кэша клиента.
+                    # Если кэш потерян (клиент удален по таймауту), клиент получит settings_stale
+                    if client_settings is not None:
+                        client_info['settings'] = client_settings
+                        client_info['settings_version'] = settings_version
+                        settings_stale = False
+                    else:
+                        client_settings = client_info.get('settings', {})
+                        settings_stale = client_info.get('settings_version') != settings_version
+                    
+                    # FPS по всем клиентам: экспоненциальное сглаживание
+                    now = time.perf_counter()
+                    if now - self._fps_prev_t > self.fps_idle_gap:
+                        # После простоя окно начинается с этого кадра
+                        self._fps_last_t = now
+                        self._fps_frames = 0
+                    else:
+                        self._fps_frames += 1
+                        if self._fps_frames >= self.fps_window:
+                            instant_fps = self._fps_frames / (now - self._fps_last_t)
+                            fps = self.stats['fps']
+                            self.stats['fps'] = 0.9 * fps + 0.1 * instant_fps if fps else instant_fps
+                            self._fps_last_t = now
+                            self._fps_frames = 0
+                    self._fps_prev_t = now
                 
                 # Декодирование изображения
-                if ',' in image_data:
-                    image_data = image_data.split(',')[1]
-                
-                img_bytes = base64.b64decode(image_data)
-                nparr = np.frombuffer(img_bytes, np.uint8)
-                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                frame = _decode_image(img_bytes)
                 
                 if frame is None:
-                    return jsonify({'success': False, 'error': 'Не удалось декодировать изображение'})
+                    return _json_response({'success': False, 'error': 'Не удалось декодировать изображение'})
                 
                 # Обновление статистики
-                self.stats['total_frames'] += 1
-                self.stats['fps'] = len(self.clients) * 10
+                with self.annotations_lock:
+                    self.stats['total_frames'] += 1
+                    frame_number = self.stats['total_frames']
                 
-                # Сохранение кадра
-                with self.frame_lock:
-                    self.latest_frame = frame.copy()
+                # Сохранение кадра: декодер каждый раз выделяет новый буфер,
+                # а кадр дальше не изменяется, поэтому достаточно подменить ссылку.
+                # Кортеж заменяется одним присваиванием - блокировка не нужна
+                self._latest = (next(self._frame_seq), frame)
                 
                 # Детекция объектов
                 annotations = []
                 if not self.pause_annotation:
                     confidence = client_settings.get('confidence', 0.5)
-                    detection_mode = client_settings.get('detection_mode', 'balanced')
+                    # Страница присылает настройки в camelCase; snake_case - для прочих клиентов
+                    detection_mode = client_settings.get('detectionMode',
+                                                         client_settings.get('detection_mode', 'balanced'))
                     
-                    # Настройки модели в зависимости от режима
-                    model_args = {
-                        'verbose': False,
-                        'conf': confidence
-                    }
-                    
-                    if detection_mode == 'fast':
-                        model_args['half'] = False
-                        model_args['device'] = 'cpu'
-                    elif detection_mode == 'accurate':
-                        model_args['iou'] = 0.3
-                        model_args['agnostic_nms'] = True
+                    # Перцептивный хэш кадра для оценки изменений в сцене
+                    frame_hash = _dhash(frame)
+                    cache_key = (confidence, detection_mode)
+                    last_hash = client_info.get('last_infer_hash')
                     
-                    results = self.model(frame, **model_args)
-                    result = results[0]
+                    if (last_hash is not None and client_info.get('cache_key') == cache_key and
+                            bin(frame_hash ^ last_hash).count('1') < self.hash_threshold):
+                        # Сцена почти не изменилась - используем результаты прошлого инференса
+                        annotations = client_info['last_annotations']
+                        current_objects = None
+                    else:
+                        current_objects, annotations = self.detect_objects(frame, confidence, detection_mode)
+                        client_info['last_infer_hash'] = frame_hash
+                        client_info['cache_key'] = cache_key
+                        client_info['last_annotations'] = annotations
                     
-                    if result.boxes is not None:
-                        boxes = result.boxes.cpu().numpy()
-                        
-                        current_objects = OrderedDict()
-                        for i in range(len(boxes)):
-                            box = boxes[i]
-                            conf = box.conf[0]
-                            
-                            if conf > confidence:
-                                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                                cls_id = int(box.cls[0])
-                                label = self.model.names[cls_id]
-                                
-                                obj_id = f"{label}_{i}_{self.stats['total_frames']}"
+                    if current_objects is not None:
+                        # Проверка и сохранение - одной критической секцией,
+                        # чтобы номера сохраненных кадров и prev_objects не перемешались
+                        with self.annotations_lock:
+                            if self.has_significant_changes(current_objects):
+                                self.stats['saved_frames'] += 1
+                                timestamp = datetime.now().isoformat()
                                 
-                                current_objects[obj_id] = {
-                                    'label': label,
-                                    'class_id': cls_id,
-                                    'x1': x1,
-                                    'y1': y1,
-                                    'x2': x2,
-                                    'y2': y2,
-                                    'confidence': float(conf)
+                                frame_annotation = {
+                                    'frame_number': frame_number,
+                                    'saved_index': self.stats['saved_frames'],
+                                    'timestamp': timestamp,
+                                    'objects': current_objects,
+                                    'client_id': client_id,
+                                    'settings': client_settings
                                 }
                                 
-                                # Для возврата клиенту
-                                annotations.append({
-                                    'label': label,
-                                    'x1': x1,
-                                    'y1': y1,
-                                    'x2': x2,
-                                    'y2': y2,
-                                    'confidence': float(conf)
-                                })
+                                self._add_annotation(f"frame_{self.stats['saved_frames']}", frame_annotation)
+                                self.prev_objects = current_objects
                                 
-                                # Обновление статистики
-                                self.stats['object_counts'][label] = self.stats['object_counts'].get(label, 0) + 1
-                        
-                        # Проверка на сохранение
-                        if self.has_significant_changes(current_objects):
-                            self.stats['saved_frames'] += 1
-                            
-                            frame_annotation = {
-                                'frame_number': self.stats['total_frames'],
-                                'saved_index': self.stats['saved_frames'],
-                                'timestamp': datetime.now().isoformat(),
-                                'objects': current_objects,
-                                'client_id': client_id,
-                                'settings': client_settings
-                            }
-                            
-                            self.annotations[f"frame_{self.stats['saved_frames']}"] = frame_annotation
-                            self.prev_objects = current_objects.copy()
-                            
-                            # Обновление истории
-                            self.stats['detection_history'].append({
-                                'timestamp': datetime.now().isoformat(),
-                                'object_count': len(current_objects)
-                            })
-                            
-                            if len(self.stats['detection_history']) > 100:
-                                self.stats['detection_history'] = self.stats['detection_history'][-100:]
-                
-                # Обновление общего количества объектов
-                self.stats['total_objects'] = sum(len(frame['objects']) 
-                                                 for frame in self.annotations.values())
+                                # Обновление истории
+                                self.stats['detection_history'].append({
+                                    'timestamp': timestamp,
+                                    'object_count': len(current_objects)
+                                })
                 
-                return jsonify({
+                self._notify_stats()
+                return _json_response({
                     'success': True,
                     'annotations': annotations,
-                    'frame_number': self.stats['total_frames']
+                    'frame_number': frame_number,
+                    'settings_stale': settings_stale
                 })
                 
             except Exception as e:
                 logger.error(f"Ошибка обработки кадра: {e}")
-                return jsonify({'success': False, 'error': str(e)})
+                return _json_response({'success': False, 'error': str(e)})
         
         @app.route('/api/stats')
         def get_stats():
-            """Получение статистики"""
-            recent_detections = self.get_recent_detections(10)
+            """Получение статистики (ETag: неизменившаяся статистика отдается как 304)"""
+            body, etag = self._stats_payload()
+            resp = Response(body, mimetype='application/json',
+                            headers={'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'})
+            resp.set_etag(etag)
+            resp = resp.make_conditional(request)
+            if resp.status_code == 200 and len(body) > 1024 and 'gzip' in request.accept_encodings:
+                resp.set_data(gzip.compress(body, 5))
+                resp.headers['Content-Encoding'] = 'gzip'
+            return resp
+        
+        @app.route('/api/stats/stream')
+        def stats_stream():
+            """Поток статистики (Server-Sent Events): событие отправляется только при изменениях"""
+            with self.stats_changed:
+                if self._stats_streams >= self.max_stats_streams:
+                    return _json_response({'error': 'Слишком много потоков статистики'}), 503
+                self._stats_streams += 1
             
-            stats_data = {
-                'total_frames': self.stats['total_frames'],
-                'saved_frames': self.stats['saved_frames'],
-                'total_objects': self.stats['total_objects'],
-                'fps': self.stats['fps'],
-                'object_counts': self.stats['object_counts'],
-                'recent_detections': recent_detections,
-                'detection_history': self.stats['detection_history'][-20:],
-                'is_paused': self.pause_annotation,
-                'active_clients': len(self.clients),
-                'settings': self.settings
-            }
-            return jsonify(stats_data)
+            def release():
+                with self.stats_changed:
+                    self._stats_streams -= 1
+            
+            def generate():
+                last_etag = None
+                generation = -1
+                while self.running:
+                    # Ожидание изменения статистики вместо периодического опроса
+                    with self.stats_changed:
+                        changed = self.stats_changed.wait_for(
+                            lambda: self._stats_generation != generation, timeout=self.stats_keepalive)
+                        generation = self._stats_generation
+                    if not changed:
+                        # Комментарий SSE не дает прокси закрыть простаивающее соединение
+                        yield b': keepalive\n\n'
+                        continue
+                    body, etag = self._stats_payload()
+                    if etag != last_etag:
+                        last_etag = etag
+                        yield b'data: ' + body + b'\n\n'
+                    # Частые изменения объединяются в одно событие
+                    time.sleep(self.stats_stream_interval)
+            
+            resp = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            # Вызывается сервером при закрытии соединения, даже если генератор не запускался
+            resp.call_on_close(release)
+            return resp
         
         @app.route('/api/take_snapshot', methods=['POST'])
         def take_snapshot():
             """Создание скриншота на сервере"""
             try:
-                with self.frame_lock:
-                    if self.latest_frame is not None:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        filename = f"snapshot_{timestamp}.jpg"
-                        filepath = self.screenshots_dir / filename
-                        
-                        cv2.imwrite(str(filepath), self.latest_frame)
-                        return jsonify({'success': True, 'filename': filename})
-                return jsonify({'success': False, 'error': 'Нет доступных кадров'})
+                # Кадр не изменяется после публикации
+                _, latest_frame = self._latest
+                
+                if latest_frame is not None:
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    filename = f"snapshot_{timestamp}.jpg"
+                    filepath = self.screenshots_dir / filename
+                    
+                    try:
+                        self.snapshot_queue.put_nowait((filepath, latest_frame))
+                    except queue.Full:
+                        return _json_response({'success': False, 'error': 'Очередь снимков переполнена'})
+                    return _json_response({'success': True, 'filename': filename})
+                return _json_response({'success': False, 'error': 'Нет доступных кадров'})
             except Exception as e:
-                return jsonify({'success': False, 'error': str(e)})
+                return _json_response({'success': False, 'error': str(e)})
         
         @app.route('/api/download_annotations')
         def download_annotations():
             """Скачивание аннотаций"""
             if self.annotations:
-                annotations_data = self.prepare_annotations_data()
                 return Response(
-                    json.dumps(annotations_data, indent=2, ensure_ascii=False),
+                    stream_with_context(self.stream_annotations_json()),
                     mimetype='application/json',
                     headers={'Content-Disposition': 'attachment; filename=annotations.json'}
                 )
-            return jsonify({'error': 'Нет аннотаций'}), 404
+            return _json_response({'error': 'Нет аннотаций'}), 404
         
         @app.route('/api/export_annotations', methods=['POST'])
         def export_annotations():
@@ -1932,48 +2859,22 @@ class WebRTCYOLOAnnotator:
                 include_statistics = data.get('include_statistics', True)
                 
                 if not self.annotations:
-                    return jsonify({'error': 'Нет аннотаций'}), 404
-                
-                annotations_data = self.prepare_annotations_data(
-                    include_images=include_images,
-                    include_metadata=include_metadata,
-                    include_statistics=include_statistics
-                )
+                    return _json_response({'error': 'Нет аннотаций'}), 404
                 
                 if format == 'json':
-                    content = json.dumps(annotations_data, indent=2, ensure_ascii=False)
+                    content = stream_with_context(self.stream_annotations_json(
+                        include_images=include_images,
+                        include_metadata=include_metadata,
+                        include_statistics=include_statistics
+                    ))
                     mimetype = 'application/json'
                     ext = 'json'
                 elif format == 'csv':
-                    # Преобразование в CSV
-                    import csv
-                    import io
-                    
-                    output = io.StringIO()
-                    writer = csv.writer(output)
-                    
-                    # Заголовок
-                    writer.writerow(['Frame', 'Object', 'X1', 'Y1', 'X2', 'Y2', 'Confidence', 'Timestamp'])
-                    
-                    # Данные
-                    for frame_id, frame in annotations_data.get('frames', {}).items():
-                        for obj_id, obj in frame.get('objects', {}).items():
-                            writer.writerow([
-                                frame_id,
-                                obj['label'],
-                                obj['x1'],
-                                obj['y1'],
-                                obj['x2'],
-                                obj['y2'],
-                                obj['confidence'],
-                                frame.get('timestamp', '')
-                            ])
-                    
-                    content = output.getvalue()
+                    content = stream_with_context(self.stream_annotations_csv())
                     mimetype = 'text/csv'
                     ext = 'csv'
                 else:
-                    return jsonify({'error': 'Формат не поддерживается'}), 400
+                    return _json_response({'error': 'Формат не поддерживается'}), 400
                 
                 return Response(
                     content,
@@ -1982,21 +2883,22 @@ class WebRTCYOLOAnnotator:
                 )
                 
             except Exception as e:
-                return jsonify({'error': str(e)}), 500
+                return _json_response({'error': str(e)}), 500
         
         @app.route('/api/save_session', methods=['POST'])
         def save_session():
             """Сохранение сессии"""
             success = self._save_to_json()
             if success:
-                return jsonify({'message': f'Сохранено {len(self.annotations)} кадров'})
-            return jsonify({'error': 'Ошибка сохранения'}), 500
+                return _json_response({'message': f'Сохранено {len(self.annotations)} кадров'})
+            return _json_response({'error': 'Ошибка сохранения'}), 500
         
         @app.route('/api/toggle_pause', methods=['POST'])
         def toggle_pause():
             """Переключение паузы"""
             self.pause_annotation = not self.pause_annotation
-            return jsonify({'paused': self.pause_annotation})
+            self._notify_stats(invalidate=True)
+            return _json_response({'paused': self.pause_annotation})
         
         @app.route('/api/update_settings', methods=['POST'])
         def update_settings():
@@ -2016,78 +2918,210 @@ class WebRTCYOLOAnnotator:
                     if key in data:
                         self.settings[key] = data[key]
                 
-                return jsonify({'message': 'Настройки обновлены', 'settings': self.settings})
+                self._notify_stats(invalidate=True)
+                return _json_response({'message': 'Настройки обновлены', 'settings': self.settings})
             except Exception as e:
-                return jsonify({'error': str(e)}), 400
+                return _json_response({'error': str(e)}), 400
         
         @app.route('/api/clear_annotations', methods=['POST'])
         def clear_annotations():
             """Очистка аннотаций"""
             try:
-                self.annotations.clear()
-                self.prev_objects = None
-                return jsonify({'success': True, 'message': 'Аннотации очищены'})
+                with self.annotations_lock:
+                    self.annotations.clear()
+                    self._annotations_version += 1
+                    self._recent_detections.clear()
+                    self.stats['total_objects'] = 0
+                    self.prev_objects = None
+                self._notify_stats(invalidate=True)
+                return _json_response({'success': True, 'message': 'Аннотации очищены'})
             except Exception as e:
-                return jsonify({'error': str(e)}), 500
+                return _json_response({'error': str(e)}), 500
         
         @app.route('/api/reset_stats', methods=['POST'])
         def reset_stats():
             """Сброс статистики"""
             try:
-                self.stats = {
-                    'total_frames': 0,
-                    'saved_frames': 0,
-                    'total_objects': 0,
-                    'fps': 0,
-                    'start_time': time.time(),
-                    'object_counts': {},
-                    'detection_history': [],
-                    'active_clients': len(self.clients)
-                }
-                return jsonify({'success': True, 'message': 'Статистика сброшена'})
+                with self.annotations_lock:
+                    self.stats = {
+                        'total_frames': 0,
+                        'saved_frames': 0,
+                        # Счетчик объектов ведется по хранимым кадрам, которые не очищаются,
+                        # и уже поддерживается инкрементально - пересчет не нужен
+                        'total_objects': self.stats['total_objects'],
+                        'fps': 0,
+                        'start_time': time.time(),
+                        'object_counts': Counter(),
+                        'detection_history': deque(maxlen=600),
+                        'active_clients': len(self.clients)
+                    }
+                with self.clients_lock:
+                    # Следующий кадр начнет новое окно FPS
+                    self._fps_prev_t = float('-inf')
+                self._notify_stats(invalidate=True)
+                return _json_response({'success': True, 'message': 'Статистика сброшена'})
             except Exception as e:
-                return jsonify({'error': str(e)}), 500
+                return _json_response({'error': str(e)}), 500
         
         logger.info(f"🌐 Сервер запущен: http://localhost:{self.flask_port}")
         logger.info("   Откройте этот адрес в браузере для использования системы")
         
-        app.run(host='0.0.0.0', port=self.flask_port, debug=False, threaded=True, use_reloader=False)
+        if serve is not None:
+            # Производственный WSGI-сервер с пулом потоков
+            threads = max(8, (os.cpu_count() or 1) * 2) + self.max_stats_streams
+            serve(app, host=self.flask_host, port=self.flask_port, threads=threads)
+        else:
+            logger.warning("waitress не установлен, используется встроенный сервер Flask")
+            app.run(host=self.flask_host, port=self.flask_port, debug=False, threaded=True, use_reloader=False)
+    
+    def _history_tail(self, count):
+        """Последние записи истории обнаружений"""
+        # Обход с конца: читается только count записей, а не вся очередь
+        tail = list(itertools.islice(reversed(self.stats['detection_history']), count))
+        tail.reverse()
+        return tail
     
     def get_recent_detections(self, count=10):
         """Получение последних обнаружений"""
-        recent = []
-        frames = list(self.annotations.values())[-10:]
-        
-        for frame in frames:
-            for obj in frame['objects'].values():
-                recent.append({
-                    'label': obj['label'],
-                    'confidence': round(obj['confidence'] * 100, 1),
-                    'timestamp': frame['timestamp']
-                })
-                if len(recent) >= count:
-                    return recent
-        return recent
+        return list(self._recent_detections)[-count:]
+    
+    def _notify_stats(self, invalidate=False):
+        """Сообщает потокам статистики об изменении; invalidate сбрасывает кэш ответа"""
+        if invalidate:
+            self._stats_cache = (0.0, None, None)
+        with self.stats_changed:
+            self._stats_generation += 1
+            self.stats_changed.notify_all()
+    
+    def _stats_payload(self):
+        """Сериализованная статистика и ее ETag; кэшируются на stats_cache_ttl для опроса и потоков"""
+        now = time.monotonic()
+        cached_at, body, etag = self._stats_cache
+        if body is not None and now - cached_at < self.stats_cache_ttl:
+            return body, etag
+        
+        stats_data = {
+            'total_frames': self.stats['total_frames'],
+            'saved_frames': self.stats['saved_frames'],
+            'total_objects': self.stats['total_objects'],
+            'fps': self.stats['fps'],
+            'object_counts': self.stats['object_counts'],
+            'recent_detections': self.get_recent_detections(10),
+            'detection_history': self._history_tail(20),
+            'is_paused': self.pause_annotation,
+            'active_clients': len(self.clients),
+            'settings': self.settings
+        }
+        body = _json_bytes(stats_data)
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._stats_cache = (now, body, etag)
+        return body, etag
+    
+    def _boxes_to_objects(self, data, scale=1.0):
+        """Разбор отфильтрованных по порогу результатов YOLO (строки x1, y1, x2, y2, conf, cls) в FrameObjects"""
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        confs = data[:, 4]
+        cls_ids = data[:, 5].astype(np.int16)
+        xyxy = (data[:, :4] / scale).astype(np.int32)
+        
+        labels = [self.model.names[cls_id] for cls_id in cls_ids.tolist()]
+        # Нумерация внутри класса (в порядке уверенности)
+        seen = Counter()
+        indices = []
+        for label in labels:
+            indices.append(seen[label])
+            seen[label] += 1
+        
+        # Обновление статистики объектов
+        self.stats['object_counts'].update(labels)
+        
+        return FrameObjects(indices, labels, cls_ids, xyxy, confs)
+    
+    def detect_objects(self, frame, confidence, detection_mode):
+        """Детекция объектов на кадре"""
+        # Параметры модели для режима вычислены заранее
+        imgsz, args_key = self.mode_presets.get(detection_mode, self.mode_presets['balanced'])
+        
+        # Уменьшение кадра до размера входа модели с сохранением пропорций
+        height, width = frame.shape[:2]
+        scale = imgsz / max(height, width)
+        if scale < 1:
+            frame = _downscale(frame, (round(width * scale), round(height * scale)))
+        else:
+            scale = 1.0
+        
+        result = self._predict(frame, confidence, args_key)
+        
+        annotations = []
+        if result.boxes is None:
+            return None, annotations
+        
+        # Пакет выполнялся с минимальным порогом среди клиентов: порог этого клиента
+        # применяется на устройстве модели, и на хост копируются только нужные строки
+        data = result.boxes.data
+        data = data[data[:, 4] > confidence]
+        
+        # Координаты возвращаются к исходному размеру кадра
+        current_objects = self._boxes_to_objects(data.cpu().numpy(), scale)
+        
+        # Для возврата клиенту
+        for label, (x1, y1, x2, y2), conf in zip(current_objects.labels, current_objects.xyxy.tolist(),
+                                                 current_objects.conf.tolist()):
+            annotations.append({
+                'label': label,
+                'x1': x1,
+                'y1': y1,
+                'x2': x2,
+                'y2': y2,
+                'confidence': conf
+            })
+        
+        return current_objects, annotations
     
-    def calculate_iou(self, box1, box2):
-        """Вычисление IoU"""
-        x1_1, y1_1, x2_1, y2_1 = box1
-        x1_2, y1_2, x2_2, y2_2 = box2
-        
-        x_left = max(x1_1, x1_2)
-        y_top = max(y1_1, y1_2)
-        x_right = min(x2_1, x2_2)
-        y_bottom = min(y2_1, y2_2)
-        
-        if x_right < x_left or y_bottom < y_top:
-            return 0.0
-        
-        intersection = (x_right - x_left) * (y_bottom - y_top)
-        area1 = (x2_1 - x1_1) * (y2_1 - y1_1)
-        area2 = (x2_2 - x1_2) * (y2_2 - y1_2)
+    def calculate_iou(self, boxes1, boxes2):
+        """Вычисление IoU для пар рамок формы (N, 4)"""
+        boxes1 = np.atleast_2d(np.asarray(boxes1, dtype=np.float64))
+        boxes2 = np.atleast_2d(np.asarray(boxes2, dtype=np.float64))
+        
+        # Координаты пересечения
+        x_left = np.maximum(boxes1[:, 0], boxes2[:, 0])
+        y_top = np.maximum(boxes1[:, 1], boxes2[:, 1])
+        x_right = np.minimum(boxes1[:, 2], boxes2[:, 2])
+        y_bottom = np.minimum(boxes1[:, 3], boxes2[:, 3])
+        
+        intersection = np.clip(x_right - x_left, 0, None) * np.clip(y_bottom - y_top, 0, None)
+        area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+        area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
         union = area1 + area2 - intersection
         
-        return intersection / union if union > 0 else 0
+        return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+    
+    def _add_annotation(self, key, frame_annotation):
+        """Добавление кадра в ограниченное хранилище аннотаций"""
+        replaced = self.annotations.pop(key, None)
+        if replaced is not None:
+            self.stats['total_objects'] -= len(replaced['objects'])
+        
+        self.annotations[key] = frame_annotation
+        self._annotations_version += 1
+        self.stats['total_objects'] += len(frame_annotation['objects'])
+        
+        objects = frame_annotation['objects']
+        for label, conf in zip(objects.labels, objects.conf.tolist()):
+            self._recent_detections.append({
+                'label': label,
+                'confidence': round(conf * 100, 1),
+                'timestamp': frame_annotation['timestamp']
+            })
+        
+        # Журнал хранит все кадры сессии, в памяти - только последние
+        record = {'frame_id': key, **frame_annotation, 'objects': frame_annotation['objects'].to_dict()}
+        self._journal.write(_json_bytes(record) + b'\n')
+        
+        # Вытеснение самых старых кадров
+        while len(self.annotations) > self.max_saved_frames:
+            _, evicted = self.annotations.popitem(last=False)
+            self.stats['total_objects'] -= len(evicted['objects'])
     
     def has_significant_changes(self, current_objects):
         """Проверка на значительные изменения"""
@@ -2097,39 +3131,49 @@ class WebRTCYOLOAnnotator:
         if len(current_objects) != len(self.prev_objects):
             return True
         
+        # Совпадение подписей - сцена неподвижна, сравнение объектов не требуется
+        if current_objects.signature == self.prev_objects.signature:
+            return False
+        
         # Проверка классов
-        current_labels = set(obj['label'] for obj in current_objects.values())
-        prev_labels = set(obj['label'] for obj in self.prev_objects.values())
-        if current_labels != prev_labels:
+        if set(current_objects.labels) != set(self.prev_objects.labels):
             return True
         
-        # Проверка положения
-        for obj_id, curr_obj in current_objects.items():
-            if obj_id in self.prev_objects:
-                prev_obj = self.prev_objects[obj_id]
-                curr_box = (curr_obj['x1'], curr_obj['y1'], curr_obj['x2'], curr_obj['y2'])
-                prev_box = (prev_obj['x1'], prev_obj['y1'], prev_obj['x2'], prev_obj['y2'])
-                
-                iou = self.calculate_iou(curr_box, prev_box)
-                if iou < self.iou_threshold:
-                    return True
-                
-                # Расстояние между центрами
-                curr_center = ((curr_obj['x1'] + curr_obj['x2']) // 2, 
-                              (curr_obj['y1'] + curr_obj['y2']) // 2)
-                prev_center = ((prev_obj['x1'] + prev_obj['x2']) // 2, 
-                              (prev_obj['y1'] + prev_obj['y2']) // 2)
-                
-                distance = np.sqrt((curr_center[0] - prev_center[0])**2 + 
-                                 (curr_center[1] - prev_center[1])**2)
-                
-                if distance > self.position_threshold:
-                    return True
+        # Проверка положения совпавших объектов. Если id идут в том же порядке
+        # (обычный случай), массивы рамок сравниваются целиком без сопоставления
+        curr_ids, prev_ids = current_objects.ids, self.prev_objects.ids
+        if curr_ids == prev_ids:
+            curr_boxes = current_objects.xyxy
+            prev_boxes = self.prev_objects.xyxy
+        else:
+            prev_index = {obj_id: i for i, obj_id in enumerate(prev_ids)}
+            matches = [(i, prev_index[obj_id]) for i, obj_id in enumerate(curr_ids)
+                       if obj_id in prev_index]
+            if not matches:
+                return False
+            
+            curr_idx, prev_idx = (list(idx) for idx in zip(*matches))
+            curr_boxes = current_objects.xyxy[curr_idx]
+            prev_boxes = self.prev_objects.xyxy[prev_idx]
+        
+        if NUMBA_AVAILABLE or len(curr_boxes) < 4:
+            # Скомпилированный цикл с ранним выходом; без numba - только для нескольких объектов
+            return _boxes_changed(curr_boxes, prev_boxes, self.position_threshold, self.iou_threshold)
+        
+        iou = self.calculate_iou(curr_boxes, prev_boxes)
+        if (iou < self.iou_threshold).any():
+            return True
+        
+        # Расстояние между центрами
+        curr_centers = (curr_boxes[:, :2] + curr_boxes[:, 2:]) // 2
+        prev_centers = (prev_boxes[:, :2] + prev_boxes[:, 2:]) // 2
+        delta = curr_centers - prev_centers
+        distance = np.hypot(delta[:, 0], delta[:, 1])
         
-        return False
+        return bool((distance > self.position_threshold).any())
     
-    def prepare_annotations_data(self, include_images=True, include_metadata=True, include_statistics=True):
-        """Подготовка данных для экспорта"""
+    def _annotations_header(self, include_metadata=True, include_statistics=True):
+        """Метаданные и статистика экспорта (все, кроме кадров)"""
         data = {}
         
         if include_metadata:
@@ -2143,19 +3187,77 @@ class WebRTCYOLOAnnotator:
             }
         
         if include_statistics:
-            data['statistics'] = self.stats
+            data['statistics'] = {**self.stats, 'detection_history': list(self.stats['detection_history'])}
         
-        frames_data = {}
-        for frame_id, frame in self.annotations.items():
-            frame_copy = frame.copy()
-            if not include_images:
-                frame_copy.pop('image_data', None)
-            frames_data[frame_id] = frame_copy
-        
-        data['frames'] = frames_data
+        return data
+    
+    def _iter_frames(self, include_images=True):
+        """Кадры для экспорта в формате словарей"""
+        # Снимок ключей: обработка кадров продолжает пополнять хранилище
+        for frame_id, frame in list(self.annotations.items()):
+            # Копия собирается за один проход: без полной копии и последующего pop
+            if include_images:
+                frame_data = {**frame, 'objects': frame['objects'].to_dict()}
+            else:
+                frame_data = {key: value for key, value in frame.items() if key != 'image_data'}
+                frame_data['objects'] = frame['objects'].to_dict()
+            yield frame_id, frame_data
+    
+    def prepare_annotations_data(self, include_images=True, include_metadata=True, include_statistics=True):
+        """Подготовка данных для экспорта"""
+        data = self._annotations_header(include_metadata, include_statistics)
+        data['frames'] = dict(self._iter_frames(include_images))
         
         return data
     
+    def stream_annotations_json(self, include_images=True, include_metadata=True, include_statistics=True):
+        """Потоковая выдача аннотаций в JSON по одному кадру"""
+        yield b'{'
+        for key, value in self._annotations_header(include_metadata, include_statistics).items():
+            yield _json_bytes(key) + b':' + _json_bytes(value) + b','
+        yield b'"frames":{'
+        
+        separator = b''
+        for frame_id, frame in self._iter_frames(include_images):
+            yield separator + _json_bytes(frame_id) + b':' + _json_bytes(frame)
+            separator = b','
+        yield b'}}'
+    
+    def stream_annotations_msgpack(self):
+        """Потоковая выдача аннотаций в MessagePack по одному кадру (та же структура, что и JSON)"""
+        packer = msgpack.Packer(use_bin_type=True)
+        header = self._annotations_header()
+        # Снимок ключей: размер карты кадров записывается заранее
+        frames = list(self.annotations.items())
+        
+        yield packer.pack_map_header(len(header) + 1)
+        for key, value in header.items():
+            yield packer.pack(key) + packer.pack(value)
+        yield packer.pack('frames') + packer.pack_map_header(len(frames))
+        for frame_id, frame in frames:
+            yield packer.pack(frame_id) + packer.pack({**frame, 'objects': frame['objects'].to_dict()})
+    
+    def stream_annotations_csv(self):
+        """Потоковая выдача аннотаций в CSV: одна порция строк на кадр"""
+        yield 'Frame,Object,X1,Y1,X2,Y2,Confidence,Timestamp\r\n'
+        
+        # Числовые поля не требуют экранирования; метки повторяются - экранируются один раз
+        labels = {}
+        # Снимок ключей: обработка кадров продолжает пополнять хранилище
+        for frame_id, frame in list(self.annotations.items()):
+            objects = frame['objects']
+            if not len(objects.labels):
+                continue
+            prefix = _csv_field(frame_id)
+            timestamp = _csv_field(frame.get('timestamp', ''))
+            rows = []
+            for label, (x1, y1, x2, y2), conf in zip(objects.labels, objects.xyxy.tolist(), objects.conf.tolist()):
+                field = labels.get(label)
+                if field is None:
+                    field = labels[label] = _csv_field(label)
+                rows.append(f"{prefix},{field},{x1},{y1},{x2},{y2},{conf:.4f},{timestamp}\r\n")
+            yield ''.join(rows)
+    
     def run(self):
         """Основной цикл"""
         logger.info("🚀 Vision AI Annotator запущен")
@@ -2163,8 +3265,8 @@ class WebRTCYOLOAnnotator:
         logger.info("   Для выхода нажмите Ctrl+C")
         
         try:
-            while self.running:
-                time.sleep(1)
+            # Ожидание без периодических пробуждений до сигнала остановки
+            self._stop_event.wait()
                 
         except KeyboardInterrupt:
             logger.info("Завершение работы...")
@@ -2175,20 +3277,69 @@ class WebRTCYOLOAnnotator:
     
     def _save_to_json(self, final=False):
         """Сохранение в JSON"""
-        try:
-            if self.annotations:
-                data = self.prepare_annotations_data()
-                filename = 'autosave_annotations.json' if not final else self.output_file
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False)
-                logger.info(f"Сохранено {len(self.annotations)} кадров в {filename}")
-                return True
-        except Exception as e:
-            logger.error(f"Ошибка сохранения: {e}")
-        return False
+        with self._save_lock:
+            try:
+                if not final and not self._journal.closed:
+                    # Журнал уже содержит новые кадры (дописываются по одному при добавлении):
+                    # сбрасываем его буфер, чтобы точка сохранения включала их независимо от снимка
+                    self._journal.flush()
+                
+                if self.annotations:
+                    if final:
+                        filename = str(self.output_file)
+                    else:
+                        # Автосохранения читаются только программами - MessagePack, если доступен
+                        filename = 'autosave_annotations.msgpack' if msgpack is not None else 'autosave_annotations.json'
+                    version = self._annotations_version
+                    if self._saved_versions.get(filename) == version:
+                        return True
+                    
+                    # Запись во временный файл и атомарная замена
+                    tmp_filename = f"{filename}.tmp"
+                    try:
+                        if filename.endswith('.gz'):
+                            # Сжатие на лету: повторяющиеся ключи JSON сжимаются в разы, а уровень 3 быстрее записи на диск
+                            out = gzip.open(tmp_filename, 'wb', compresslevel=3)
+                        else:
+                            # Крупный буфер: потоковая запись по кадру уходит на диск блоками по 1 МБ
+                            out = open(tmp_filename, 'wb', buffering=1 << 20)
+                        with out as f:
+                            if final and len(self.annotations) <= self.pretty_save_max_frames:
+                                f.write(_json_bytes(self.prepare_annotations_data(), indent=True))
+                            elif not final and msgpack is not None:
+                                f.writelines(self.stream_annotations_msgpack())
+                            else:
+                                f.writelines(self.stream_annotations_json())
+                        os.replace(tmp_filename, filename)
+                    except Exception:
+                        # Недописанный временный файл не оставляем рядом с сохранением
+                        if os.path.exists(tmp_filename):
+                            os.remove(tmp_filename)
+                        raise
+                    
+                    self._saved_versions[filename] = version
+                    # Аргументы форматируются лениво, только если сообщение проходит уровень логгера
+                    logger.info("Сохранено %d кадров в %s", len(self.annotations), filename)
+                    return True
+            except Exception as e:
+                logger.error(f"Ошибка сохранения: {e}")
+            return False
+
+def parse_args():
+    """Параметры командной строки (значения по умолчанию - из переменных окружения)"""
+    parser = argparse.ArgumentParser(description='Vision AI Annotator - камера через браузер')
+    parser.add_argument('--host', default=os.environ.get('SYSMON_HOST', '0.0.0.0'),
+                        help='адрес веб-сервера (SYSMON_HOST)')
+    parser.add_argument('--port', type=int, default=os.environ.get('SYSMON_PORT', '3000'),
+                        help='порт веб-сервера (SYSMON_PORT, по умолчанию 3000)')
+    parser.add_argument('--output', default='annotations.json',
+                        help='файл аннотаций (с расширением .gz - сжатый)')
+    return parser.parse_args()
 
 def main():
     """Точка входа"""
+    args = parse_args()
+    
     print("\n" + "="*60)
     print("🚀 VISION AI ANNOTATOR - Modern Web Interface")
     print("="*60)
@@ -2211,11 +3362,8 @@ def main():
     print("="*60)
     
     try:
-        port = int(input(f"Введите порт [по умолчанию 3000]: ") or "3000")
-        annotator = WebRTCYOLOAnnotator(flask_port=port)
+        annotator = WebRTCYOLOAnnotator(flask_port=args.port, flask_host=args.host, output_file=args.output)
         annotator.run()
-    except ValueError:
-        print("Ошибка: порт должен быть числом")
     except Exception as e:
         print(f"Ошибка запуска: {e}")
     finally: